@@ -1,16 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
 from .forms import InklingForm, SearchForm, URLReferenceForm
-from .models import NodeModel
 
 
 def sidebar_data(request):
     if not request.user.is_authenticated:
         return dict()
+    # Nothing here is built or queried unless a template uses it. The sidebar's lists and the tag picker's options are fetched separately (views.sidebar_page, views.tag_options).
     return dict(
-        search_form=SearchForm(),
-        new_inkling_form=InklingForm(),
-        new_reference_form=URLReferenceForm(),
-        all_memos=request.user.memo_set.all(),
-        all_tags=request.user.tag_set.all(),
-        all_references=request.user.reference_set.all(),
+        search_form=SimpleLazyObject(SearchForm),
+        new_inkling_form=SimpleLazyObject(InklingForm),
+        new_reference_form=SimpleLazyObject(URLReferenceForm),
         link_types=request.user.linktype_set.all(),
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,215 @@
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import requests
+from django.conf import settings
+
+
+class EmbeddingBackend(ABC):
+    # Longest input the encoder accepts, in tokens, including [CLS] and [SEP]
+    max_length: int = 512
+
+    @abstractmethod
+    def get_tokenizer(self):
+        """
+        The encoder's tokenizers.Tokenizer, with truncation and padding turned off.
+        """
+        ...
+
+    @abstractmethod
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        """
+        Return one embedding per chunk of already tokenized input (including special tokens),
+        as a float32 array of shape (len(token_ids), dimensions).
+        """
+        ...
+
+    def encode(self, chunks: list[str]) -> np.ndarray:
+        """
+        Tokenize and encode texts, truncating any that are longer than the encoder accepts.
+        """
+        tokenizer = self.get_tokenizer()
+        encodings = tokenizer.encode_batch(chunks, add_special_tokens=False)
+        for encoding in encodings:
+            encoding.truncate(self.max_length - tokenizer.num_special_tokens_to_add(False))
+        return self.encode_ids([tokenizer.post_process(encoding).ids for encoding in encodings])
+
+    def load_model(self):
+        """
+        Load whatever the backend needs up front, instead of on the first call to encode.
+        """
+        pass
+
+
+@dataclass
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Runs the encoder in this process. The model is loaded on first use.
+    """
+    model_name: str
+    max_batch_tokens: int = 8192
+    max_length: int = 512
+    model: Optional[object] = field(default=None, repr=False)
+    tokenizer: Optional[object] = field(default=None, repr=False)
+
+    def load_model(self):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name)
+        return self.model
+
+    def get_tokenizer(self):
+        # Only the tokenizer files are loaded, so chunking doesn't need the model (or torch) in memory
+        if self.tokenizer is None:
+            from transformers import AutoTokenizer
+            self.tokenizer = prepare_tokenizer(AutoTokenizer.from_pretrained(self.model_name).backend_tokenizer)
+        return self.tokenizer
+
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        import torch
+        model = self.load_model()
+        embeddings = np.zeros((len(token_ids), model.get_sentence_embedding_dimension()), dtype=np.float32) # type: ignore
+        for batch in pack_batches([len(ids) for ids in token_ids], self.max_batch_tokens):
+            input_ids, attention_mask = pad_token_ids([token_ids[i] for i in batch])
+            features = {
+                'input_ids': torch.from_numpy(input_ids).to(model.device), # type: ignore
+                'attention_mask': torch.from_numpy(attention_mask).to(model.device), # type: ignore
+                'token_type_ids': torch.zeros(input_ids.shape, dtype=torch.long, device=model.device), # type: ignore
+            }
+            with torch.inference_mode():
+                embeddings[batch] = model(features)['sentence_embedding'].float().cpu().numpy() # type: ignore
+        return embeddings
+
+
+@dataclass
+class OnnxBackend(EmbeddingBackend):
+    """
+    Runs an int8-quantized ONNX export of the encoder (manage.py export_onnx_encoder) with onnxruntime,
+    so neither torch nor sentence-transformers has to be imported. Uses the same tokenizer and the same
+    pooling as the sentence-transformers model: the normalized hidden state of the [CLS] token.
+    """
+    model_dir: str
+    max_batch_tokens: int = 8192
+    max_length: int = 512
+    session: Optional[object] = field(default=None, repr=False)
+    tokenizer: Optional[object] = field(default=None, repr=False)
+
+    def load_model(self):
+        if self.session is None:
+            import onnxruntime
+            self.session = onnxruntime.InferenceSession(os.path.join(self.model_dir, 'model_quantized.onnx'), providers=['CPUExecutionProvider'])
+        return self.session
+
+    def get_tokenizer(self):
+        if self.tokenizer is None:
+            from tokenizers import Tokenizer
+            self.tokenizer = prepare_tokenizer(Tokenizer.from_file(os.path.join(self.model_dir, 'tokenizer.json')))
+        return self.tokenizer
+
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        if not token_ids:
+            return np.zeros((0, 0), dtype=np.float32)
+        session = self.load_model()
+        input_names = {node.name for node in session.get_inputs()} # type: ignore
+        embeddings: list[Optional[np.ndarray]] = [None] * len(token_ids)
+        for batch in pack_batches([len(ids) for ids in token_ids], self.max_batch_tokens):
+            input_ids, attention_mask = pad_token_ids([token_ids[i] for i in batch])
+            inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in input_names:
+                inputs['token_type_ids'] = np.zeros_like(input_ids)
+            hidden_states = session.run(None, inputs)[0] # type: ignore
+            for row, i in enumerate(batch):
+                embeddings[i] = hidden_states[row, 0]
+        stacked = np.stack(embeddings).astype(np.float32) # type: ignore
+        return stacked / np.linalg.norm(stacked, axis=1, keepdims=True)
+
+
+@dataclass
+class EmbeddingServerBackend(EmbeddingBackend):
+    """
+    Sends token ids to the shared embedding server (manage.py embedding_server),
+    and encodes them in this process instead if the server can't be reached.
+    Tokenizing stays local, with the fallback's tokenizer.
+    """
+    url: str
+    fallback: EmbeddingBackend
+    timeout: float = 30.0
+
+    def __post_init__(self):
+        self.max_length = self.fallback.max_length
+
+    def get_tokenizer(self):
+        return self.fallback.get_tokenizer()
+
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        try:
+            response = requests.post(f"{self.url.rstrip('/')}/encode", json={'token_ids': token_ids}, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return self.fallback.encode_ids(token_ids)
+        return np.frombuffer(response.content, dtype=np.float32).reshape(len(token_ids), -1)
+
+
+def prepare_tokenizer(tokenizer):
+    # Chunking cuts its own windows, and batches are padded when they're encoded
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def pad_token_ids(token_ids: list[list[int]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Right-pad a batch of token id lists into (input_ids, attention_mask) arrays.
+    """
+    width = max(len(ids) for ids in token_ids)
+    input_ids = np.zeros((len(token_ids), width), dtype=np.int64)
+    attention_mask = np.zeros((len(token_ids), width), dtype=np.int64)
+    for row, ids in enumerate(token_ids):
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def pack_batches(lengths: list[int], max_tokens: int) -> list[list[int]]:
+    """
+    Group chunk indices into batches of similar length, so little of each forward pass is spent on padding.
+    A batch is closed once its padded size would exceed max_tokens.
+    """
+    batches = []
+    batch = []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # Chunks come sorted by length, so the current chunk sets the padded length of the batch
+        if batch and lengths[i] * (len(batch) + 1) > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_local_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """
+    The backend that encodes in this process: 'onnx' or 'torch', defaulting to settings.EMBEDDING_BACKEND.
+    """
+    name = name or settings.EMBEDDING_BACKEND
+    if name == 'onnx':
+        return OnnxBackend(str(settings.EMBEDDING_ONNX_DIR), max_batch_tokens=settings.EMBEDDING_BATCH_TOKENS, max_length=settings.EMBEDDING_MAX_TOKENS)
+    if name == 'torch':
+        return SentenceTransformerBackend(settings.EMBEDDING_MODEL_NAME, max_batch_tokens=settings.EMBEDDING_BATCH_TOKENS, max_length=settings.EMBEDDING_MAX_TOKENS)
+    raise ValueError(f"Unknown embedding backend {name!r}, expected 'onnx' or 'torch'")
+
+
+BACKEND: Optional[EmbeddingBackend] = None
+
+def get_backend() -> EmbeddingBackend:
+    global BACKEND
+    if BACKEND is None:
+        if settings.EMBEDDING_SERVER_URL:
+            BACKEND = EmbeddingServerBackend(settings.EMBEDDING_SERVER_URL, fallback=get_local_backend())
+        else:
+            BACKEND = get_local_backend()
+    return BACKEND
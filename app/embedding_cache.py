@@ -0,0 +1,106 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from unidecode import unidecode
+
+from .models import CachedEmbedding
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def normalize_document(text: str) -> str:
+    """
+    Like normalize_text, but keeping the paragraph breaks, since they decide how the text is chunked.
+    """
+    paragraphs = (normalize_text(paragraph) for paragraph in PARAGRAPH_BREAK.split(text))
+    return '\n\n'.join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Search queries that differ only in case, accents or whitespace are the same search.
+    The encoder's tokenizer lowercases and strips accents itself, so this doesn't change their embedding.
+    """
+    return normalize_text(unidecode(query)).casefold()
+
+
+def document_key(text: str, title: Optional[str] = None) -> str:
+    document = normalize_document(text) + '\x00' + normalize_text(title or '')
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def query_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model name, document hash), stored in postgres so that every worker shares them,
+    with a byte-bounded LRU in front so repeated lookups in the same process don't hit the database.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def get_many(self, model_name: str, keys: list[str]) -> dict[str, np.ndarray]:
+        found = dict()
+        with self.lock:
+            for key in keys:
+                embedding = self.entries.get((model_name, key))
+                if embedding is not None:
+                    self.entries.move_to_end((model_name, key))
+                    found[key] = embedding
+            self.counts['memory_hits'] += len(found)
+
+        remaining = [key for key in keys if key not in found]
+        if remaining:
+            stored = CachedEmbedding.objects.filter(model_name=model_name, key__in=remaining).values_list('key', 'embedding')
+            from_database = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in stored}
+            self._remember(model_name, from_database)
+            found.update(from_database)
+            with self.lock:
+                self.counts['database_hits'] += len(from_database)
+                self.counts['misses'] += len(set(remaining) - from_database.keys())
+        return found
+
+    def set_many(self, model_name: str, embeddings: dict[str, np.ndarray]):
+        CachedEmbedding.objects.bulk_create(
+            [CachedEmbedding(model_name=model_name, key=key, embedding=embedding) for key, embedding in embeddings.items()],
+            ignore_conflicts=True,
+        )
+        self._remember(model_name, embeddings)
+
+    def stats(self) -> dict[str, int]:
+        return dict(self.counts, entries=len(self.entries), bytes=self.size)
+
+    def _remember(self, model_name: str, embeddings: dict[str, np.ndarray]):
+        with self.lock:
+            for key, embedding in embeddings.items():
+                if (model_name, key) in self.entries:
+                    continue
+                embedding = np.asarray(embedding, dtype=np.float32)
+                self.entries[(model_name, key)] = embedding
+                self.size += self._entry_size(key, embedding)
+            while self.size > self.max_bytes and self.entries:
+                (_model_name, key), embedding = self.entries.popitem(last=False)
+                self.size -= self._entry_size(key, embedding)
+
+    @staticmethod
+    def _entry_size(key: str, embedding: np.ndarray) -> int:
+        return len(key) + embedding.nbytes
+
+
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_MAX_BYTES)
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import timedelta
+from typing import Optional, Union
+
+import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.db.models import Q
+
+from .embeddings import generate_embeddings, generate_passage_embeddings
+from .job_queue import claim_jobs, complete_jobs, retry_jobs_later
+from .models import (EmbeddableModel, EmbeddingJob, Link, NodeChunk, NodeModel,
+                     TitleAndContentModel, User, bump_corpus_versions,
+                     prefetch_link_endpoints)
+
+# How long to wait before retrying a link whose endpoints have no embedding yet
+LINK_RETRY_DELAY = timedelta(seconds=5)
+
+
+def enqueue_embedding(obj: Union[EmbeddableModel, User]):
+    EmbeddingJob.enqueue([obj])
+
+
+def process_embedding_jobs(batch_size: int = 64) -> int:
+    """
+    Claim a batch of jobs, encode all of their texts together and write the vectors back in bulk.
+    Returns the number of jobs claimed.
+    """
+    jobs = claim_jobs(EmbeddingJob, batch_size)
+    if not jobs:
+        return 0
+
+    objects_by_job = _load_job_objects(jobs)
+    missing = [job for job in jobs if job.pk not in objects_by_job]
+    # Jobs for objects whose embedding already matches their inputs, e.g. queued twice, have nothing to do
+    current = [job for job in jobs if job.pk in objects_by_job and not _is_stale(objects_by_job[job.pk])]
+    deferred = [job for job in jobs if job.pk in objects_by_job and job not in current and not _is_ready(objects_by_job[job.pk])]
+    ready = [job for job in jobs if job.pk in objects_by_job and job not in current and job not in deferred]
+
+    complete_jobs(missing + current)
+    retry_jobs_later(deferred, delay=LINK_RETRY_DELAY)
+
+    try:
+        objects = [objects_by_job[job.pk] for job in ready]
+        # Nodes with content also get an embedding per passage, and their document embedding is pooled from those
+        nodes = [obj for obj in objects if isinstance(obj, TitleAndContentModel)]
+        others = [obj for obj in objects if not isinstance(obj, TitleAndContentModel)]
+        passages_by_node = dict()
+        for node, (embedding, passages) in zip(nodes, generate_passage_embeddings([get_document(node) for node in nodes])):
+            node.embedding = embedding # type: ignore
+            passages_by_node[node] = passages
+        for obj, embedding in zip(others, generate_embeddings([get_document(obj) for obj in others])):
+            setattr(obj, get_embedding_field(obj), combine_embedding(obj, embedding))
+        for obj in objects:
+            setattr(obj, get_version_field(obj), settings.EMBEDDING_MODEL_VERSION)
+            if isinstance(obj, EmbeddableModel):
+                obj.embedding_hash = obj.get_embedding_inputs_hash()
+        _save_embeddings(objects, passages_by_node)
+    except Exception as e:
+        retry_jobs_later(ready, error=repr(e))
+        raise
+
+    _enqueue_dependent_links(objects)
+    # The new embeddings change the results of searches over these objects
+    bump_corpus_versions(obj.user_id for obj in objects if isinstance(obj, EmbeddableModel)) # type: ignore
+
+    complete_jobs(ready)
+    return len(jobs)
+
+
+def _load_job_objects(jobs: list[EmbeddingJob]) -> dict[int, models.Model]:
+    pks_by_content_type = defaultdict(list)
+    for job in jobs:
+        pks_by_content_type[job.content_type_id].append(job.object_id) # type: ignore
+    objects_by_content_type = {}
+    for content_type_id, pks in pks_by_content_type.items():
+        model_class = ContentType.objects.get_for_id(content_type_id).model_class()
+        queryset = model_class.objects.all() # type: ignore
+        if issubclass(model_class, EmbeddableModel):
+            queryset = queryset.with_heavy_fields()
+        if model_class is Link:
+            queryset = queryset.select_related('link_type')
+        objects_by_content_type[content_type_id] = queryset.in_bulk(pks)
+    prefetch_link_endpoints((obj for objects in objects_by_content_type.values() for obj in objects.values()), with_embeddings=True)
+    objects_by_job = dict()
+    for job in jobs:
+        obj = objects_by_content_type[job.content_type_id].get(job.object_id) # type: ignore
+        if obj is not None:
+            objects_by_job[job.pk] = obj
+    return objects_by_job
+
+
+def get_embedding_field(obj: models.Model) -> str:
+    return 'intention_embedding' if isinstance(obj, User) else 'embedding'
+
+
+def get_version_field(obj: models.Model) -> str:
+    return f'{get_embedding_field(obj)}_version'
+
+
+def get_document(obj: models.Model) -> tuple[str, Optional[str]]:
+    if isinstance(obj, User):
+        return obj.intention or '', None
+    return obj.get_embedding_document() # type: ignore
+
+
+def _is_stale(obj: models.Model) -> bool:
+    # Users don't track what their intention embedding was computed from, so it is always recomputed
+    return obj.embedding_is_stale() if isinstance(obj, EmbeddableModel) else True
+
+
+def _is_ready(obj: models.Model) -> bool:
+    """
+    A link's embedding is built from the embeddings of its endpoints, so it has to wait for them.
+    """
+    if isinstance(obj, Link):
+        return all(end is not None and end.embedding is not None for end in [obj.source_content_object, obj.target_content_object])
+    return True
+
+
+def combine_embedding(obj: models.Model, embedding: np.ndarray) -> np.ndarray:
+    """
+    The embedding stored for `obj`, given the embedding of its document: links mix in those of their endpoints.
+    """
+    if isinstance(obj, Link):
+        return (0.2 * embedding) + (0.4 * obj.source_content_object.embedding) + (0.4 * obj.target_content_object.embedding) # type: ignore
+    return embedding
+
+
+def _save_embeddings(objects: list[models.Model], passages_by_node: dict):
+    objects_by_model = defaultdict(list)
+    for obj in objects:
+        objects_by_model[type(obj)].append(obj)
+    with transaction.atomic():
+        for model_class, model_objects in objects_by_model.items():
+            fields = [get_embedding_field(model_objects[0]), get_version_field(model_objects[0])]
+            if issubclass(model_class, EmbeddableModel):
+                fields.append('embedding_hash')
+            model_class.objects.bulk_update(model_objects, fields)
+        for node, passages in passages_by_node.items():
+            NodeChunk.replace_for(node, passages)
+
+
+def _enqueue_dependent_links(objects: list[models.Model]):
+    """
+    Links mix their endpoints' embeddings into their own, so re-embedding a node makes its links stale.
+    """
+    pks_by_content_type = defaultdict(list)
+    for obj in objects:
+        if isinstance(obj, NodeModel):
+            pks_by_content_type[ContentType.objects.get_for_model(obj)].append(obj.pk)
+    if not pks_by_content_type:
+        return
+    endpoint_filter = Q()
+    for content_type, pks in pks_by_content_type.items():
+        endpoint_filter |= Q(source_content_type=content_type, source_object_id__in=pks)
+        endpoint_filter |= Q(target_content_type=content_type, target_object_id__in=pks)
+    Link.objects.filter(endpoint_filter).enqueue_stale_embeddings()
@@ -0,0 +1,113 @@
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+
+from .embedding_backends import EmbeddingBackend
+
+
+@dataclass
+class PendingRequest:
+    token_ids: list[list[int]]
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[np.ndarray] = None
+    error: Optional[Exception] = None
+
+
+class MicroBatcher:
+    """
+    Collects the chunks of concurrent requests for up to max_wait seconds (or until max_chunks are waiting)
+    and encodes them in one backend call, so simultaneous searches share forward passes.
+    """
+    def __init__(self, backend: EmbeddingBackend, max_wait: float = 0.01, max_chunks: int = 256):
+        self.backend = backend
+        self.max_wait = max_wait
+        self.max_chunks = max_chunks
+        self.requests: queue.Queue[PendingRequest] = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        request = PendingRequest(token_ids)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result # type: ignore
+
+    def _run(self):
+        while True:
+            self._encode_batch(self._collect_batch())
+
+    def _collect_batch(self) -> list[PendingRequest]:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while sum(len(request.token_ids) for request in batch) < self.max_chunks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _encode_batch(self, batch: list[PendingRequest]):
+        try:
+            embeddings = self.backend.encode_ids([ids for request in batch for ids in request.token_ids])
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        position = 0
+        for request in batch:
+            request.result = embeddings[position:position + len(request.token_ids)]
+            position += len(request.token_ids)
+            request.done.set()
+
+
+def make_handler(batcher: MicroBatcher) -> type[BaseHTTPRequestHandler]:
+    class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/health':
+                return self.send_error(404)
+            self._respond(b'ok', 'text/plain')
+
+        def do_POST(self):
+            if self.path != '/encode':
+                return self.send_error(404)
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                token_ids = [[int(token_id) for token_id in ids] for ids in body['token_ids']]
+            except (ValueError, KeyError, TypeError):
+                return self.send_error(400, 'Expected a JSON body like {"token_ids": [[101, 2054, 102], ...]}')
+            try:
+                embeddings = batcher.encode_ids(token_ids) if token_ids else np.zeros((0, 0), dtype=np.float32)
+            except Exception as e:
+                return self.send_error(500, repr(e))
+            # Raw float32 rows: the client knows how many chunks it sent, so it can reshape them
+            self._respond(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes(), 'application/octet-stream')
+
+        def _respond(self, body: bytes, content_type: str):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingRequestHandler
+
+
+def serve(backend: EmbeddingBackend, host: str, port: int, max_wait: float, max_chunks: int):
+    batcher = MicroBatcher(backend, max_wait=max_wait, max_chunks=max_chunks)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    server.serve_forever()
@@ -1,59 +1,244 @@
-from functools import lru_cache
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
 from typing import Optional, Union
 
 import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models import Q
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
+from django.db.models import F, Q
+from django.utils import timezone
+from tokenizers import Encoding
 
-from .models import EmbeddableModel, NodeModel, Query, Tag, TaggableModel, User
+from .embedding_backends import get_backend
+from .embedding_cache import (PARAGRAPH_BREAK, document_key, embedding_cache,
+                              normalize_query, query_key)
+from .models import (EmbeddableModel, NodeChunk, NodeModel, Query,
+                     QueryEmbedding, Tag, TaggableModel, TitleAndContentModel,
+                     User, cosine_distance)
 
-MODEL = None
+# How many chunks to fetch per requested node when ranking nodes by their best chunk,
+# since several of a node's chunks can be among the nearest
+PASSAGE_OVERSAMPLE = 4
+# Reciprocal rank fusion constant: the larger it is, the less the top few ranks of a single ranking dominate
+RRF_K = 60
 
-def load_model():
-    global MODEL
-    if MODEL is None:
-        MODEL = SentenceTransformer('BAAI/bge-small-en-v1.5')
-    return MODEL
 
+@dataclass
+class Chunk:
+    start: int
+    end: int
+    # Ready to encode: including the special tokens
+    token_ids: list[int]
 
-def chunk_text(text: str, max_length: int = 200, overlap: int = 25) -> list[str]:
+
+def chunk_text(text: str, stride: Optional[int] = None) -> list[Chunk]:
+    return chunk_texts([text], stride)[0]
+
+
+def chunk_texts(texts: list[str], stride: Optional[int] = None) -> list[list[Chunk]]:
     """
-    Splits the text into smaller chunks of at most max_length tokens with an overlap.
+    Cut each text into chunks along paragraph boundaries. A paragraph of at least settings.EMBEDDING_MIN_CHUNK_TOKENS
+    tokens is a chunk of its own, and one longer than the encoder accepts is cut into windows, each overlapping the
+    previous one by `stride` tokens. Shorter paragraphs are merged into runs, about settings.EMBEDDING_CHUNK_PARAGRAPHS
+    to a chunk: a run ends after a paragraph whose tokens hash to a multiple of that, or where the next paragraph
+    wouldn't fit in the window. Where a run ends depends on its own paragraphs, not on those before it, so inserting,
+    deleting or editing a paragraph changes the chunk it is in and leaves the others, and their cached embeddings, as
+    they were. Every paragraph is tokenized once. Texts without any tokens make no chunks.
     """
-    words = text.split()
-    chunks = []
-    position = 0
+    stride = settings.EMBEDDING_CHUNK_STRIDE if stride is None else stride
+    backend = get_backend()
+    tokenizer = backend.get_tokenizer()
+    window = backend.max_length - tokenizer.num_special_tokens_to_add(False)
+    paragraphs_by_text = [_paragraph_spans(text) for text in texts]
+    encodings = iter(tokenizer.encode_batch(
+        [text[start:end] for text, paragraphs in zip(texts, paragraphs_by_text) for start, end in paragraphs],
+        add_special_tokens=False,
+    ))
+
+    chunks_by_text = []
+    for paragraphs in paragraphs_by_text:
+        chunks = []
+        run = []
+        for start, _end in paragraphs:
+            encoding = next(encodings)
+            if not encoding.ids:
+                continue
+            is_short = len(encoding.ids) < min(settings.EMBEDDING_MIN_CHUNK_TOKENS, window + 1)
+            if run and (not is_short or sum(len(part.ids) for _start, part in run) + len(encoding.ids) > window):
+                chunks.append(_make_chunk(tokenizer, run))
+                run = []
+            if is_short:
+                run.append((start, encoding))
+                if _ends_run(encoding):
+                    chunks.append(_make_chunk(tokenizer, run))
+                    run = []
+            elif len(encoding.ids) > window:
+                encoding.truncate(window, stride=stride)
+                chunks.extend(_make_chunk(tokenizer, [(start, part)]) for part in [encoding] + encoding.overflowing)
+            else:
+                chunks.append(_make_chunk(tokenizer, [(start, encoding)]))
+        if run:
+            chunks.append(_make_chunk(tokenizer, run))
+        chunks_by_text.append(chunks)
+    return chunks_by_text
+
+
+def _paragraph_spans(text: str) -> list[tuple[int, int]]:
+    spans = []
+    start = 0
+    for paragraph_break in PARAGRAPH_BREAK.finditer(text):
+        spans.append((start, paragraph_break.start()))
+        start = paragraph_break.end()
+    spans.append((start, len(text)))
+    return spans
+
+
+def _ends_run(encoding: Encoding) -> bool:
+    return zlib.crc32(np.array(encoding.ids, dtype=np.uint32).tobytes()) % settings.EMBEDDING_CHUNK_PARAGRAPHS == 0
+
+
+def _make_chunk(tokenizer, run: list[tuple[int, Encoding]]) -> Chunk:
+    """
+    A chunk of the encodings of consecutive paragraphs, or parts of one, each paired with where it starts in the text.
+    """
+    (first_start, first), (last_start, last) = run[0], run[-1]
+    encoding = Encoding.merge([part for _start, part in run], growing_offsets=False)
+    return Chunk(first_start + first.offsets[0][0], last_start + last.offsets[-1][1], tokenizer.post_process(encoding).ids)
 
-    while position < len(words):
-        end_pos = position + max_length
-        chunk = words[position:end_pos]
-        chunks.append(' '.join(chunk))
-        position = end_pos - overlap
 
-    return chunks
+@dataclass
+class Passage:
+    start: Optional[int]
+    end: Optional[int]
+    embedding: np.ndarray
 
 
-@lru_cache(maxsize=1000)
 def generate_embedding(text: str, title: Optional[str] = None) -> np.array: # type: ignore
-    model = load_model()
-    chunks = chunk_text(text)
-    if title:
-        chunks += [title]
-    embeddings = model.encode(chunks)
-    mean_embedding = np.mean(embeddings, axis=0)
-    embedding = mean_embedding / np.linalg.norm(mean_embedding)
+    return generate_embeddings([(text, title)])[0]
+
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Embedding of a search query. Queries are normalized, and their embeddings shared through the QueryEmbedding
+    table until they are settings.QUERY_EMBEDDING_TTL old, so repeated searches from any worker skip the encoder.
+    Every call counts as a hit of the normalized query.
+    """
+    model_name = settings.EMBEDDING_MODEL_VERSION
+    key = query_key(query)
+    now = timezone.now()
+    entries = QueryEmbedding.objects.filter(model_name=model_name, key=key)
+    entry = entries.filter(encoded_at__gt=now - timedelta(seconds=settings.QUERY_EMBEDDING_TTL)).only('embedding').first()
+    if entry is not None:
+        embedding = np.asarray(entry.embedding, dtype=np.float32)
+    else:
+        normalized = normalize_query(query)
+        embedding = generate_embedding(normalized)
+        QueryEmbedding.objects.bulk_create(
+            [QueryEmbedding(model_name=model_name, key=key, query=normalized, embedding=embedding, encoded_at=now, last_used_at=now)],
+            update_conflicts=True, unique_fields=['model_name', 'key'], update_fields=['embedding', 'encoded_at'],
+        )
+    entries.update(hits=F('hits') + 1, last_used_at=now)
     return embedding
 
 
-def sort_by_distance(embedding, objects: list):
-    if not objects:
+def generate_embeddings(documents: list[tuple[str, Optional[str]]]) -> list[np.ndarray]:
+    """
+    Embed many (text, title) documents. Documents already in the embedding cache are not encoded again,
+    and the rest are encoded with a single encoder call over all of their chunks.
+    """
+    if not documents:
         return []
-    to_sort = np.stack([o.embedding for o in objects], axis=0)
-    distances = cos_sim(embedding, to_sort).tolist()[0] # type: ignore
-    sorted_objects = sorted(zip(objects, distances), key=lambda t: -t[1])
-    return [o for o, d in sorted_objects]
+    model_name = settings.EMBEDDING_MODEL_VERSION
+    keys = [document_key(text, title) for text, title in documents]
+    embeddings = embedding_cache.get_many(model_name, keys)
+
+    missing = dict()
+    for key, document in zip(keys, documents):
+        if key not in embeddings:
+            missing[key] = document
+    if missing:
+        new_embeddings = dict(zip(missing.keys(), _encode_documents(list(missing.values()))))
+        embedding_cache.set_many(model_name, new_embeddings)
+        embeddings.update(new_embeddings)
+    return [embeddings[key] for key in keys]
+
+
+def _encode_documents(documents: list[tuple[str, Optional[str]]]) -> list[np.ndarray]:
+    """
+    Encode the chunks of all documents together, then mean-pool each document's chunks into one normalized vector.
+    """
+    text_chunks = chunk_texts([text for text, _title in documents])
+    title_chunks = chunk_texts([title or '' for _text, title in documents])
+    token_ids = []
+    chunk_documents = []
+    for index, (document_text_chunks, document_title_chunks) in enumerate(zip(text_chunks, title_chunks)):
+        document_token_ids = [chunk.token_ids for chunk in document_text_chunks + document_title_chunks]
+        if not document_token_ids:
+            # Nothing but whitespace: encode the bare special tokens, as the encoder would for an empty text
+            document_token_ids = [get_backend().get_tokenizer().encode('').ids]
+        token_ids.extend(document_token_ids)
+        chunk_documents.extend([index] * len(document_token_ids))
+
+    chunk_embeddings = get_backend().encode_ids(token_ids)
+    embeddings = []
+    chunk_documents = np.array(chunk_documents)
+    for index in range(len(documents)):
+        embeddings.append(_pool(chunk_embeddings[chunk_documents == index]))
+    return embeddings
+
+
+def _pool(chunk_embeddings) -> np.ndarray:
+    mean_embedding = np.mean(chunk_embeddings, axis=0)
+    return mean_embedding / np.linalg.norm(mean_embedding)
+
+
+def generate_passage_embeddings(documents: list[tuple[str, Optional[str]]]) -> list[tuple[np.ndarray, list[Passage]]]:
+    """
+    Embed every chunk of every (text, title) document on its own, and pool each document's chunks into its embedding,
+    the same vector generate_embeddings returns. The title is the last passage, without a span.
+    Chunk embeddings are cached by chunk text, so unchanged chunks aren't encoded again.
+    """
+    text_chunks = chunk_texts([text for text, _title in documents])
+    title_chunks = chunk_texts([title or '' for _text, title in documents])
+    passages_by_document = []
+    chunks = []
+    for (text, title), document_text_chunks, document_title_chunks in zip(documents, text_chunks, title_chunks):
+        passages = [Passage(chunk.start, chunk.end, None) for chunk in document_text_chunks] # type: ignore
+        passages += [Passage(None, None, None) for _chunk in document_title_chunks] # type: ignore
+        chunks.extend((text[chunk.start:chunk.end], chunk) for chunk in document_text_chunks)
+        chunks.extend((title[chunk.start:chunk.end], chunk) for chunk in document_title_chunks) # type: ignore
+        passages_by_document.append(passages)
+
+    chunk_embeddings = iter(_embed_chunks(chunks))
+    results = []
+    for (text, title), passages in zip(documents, passages_by_document):
+        for passage in passages:
+            passage.embedding = next(chunk_embeddings)
+        if passages:
+            embedding = _pool([passage.embedding for passage in passages])
+        else:
+            embedding = generate_embedding(text, title)
+        results.append((embedding, passages))
+    return results
+
+
+def _embed_chunks(chunks: list[tuple[str, Chunk]]) -> list[np.ndarray]:
+    """
+    Embed (text, chunk) pairs, looking each chunk up in the embedding cache by its text and encoding the rest from their token ids.
+    """
+    model_name = settings.EMBEDDING_MODEL_VERSION
+    keys = [document_key(text) for text, _chunk in chunks]
+    embeddings = embedding_cache.get_many(model_name, keys)
+    missing = {key: chunk for key, (_text, chunk) in zip(keys, chunks) if key not in embeddings}
+    if missing:
+        encoded = get_backend().encode_ids([chunk.token_ids for chunk in missing.values()])
+        new_embeddings = {key: _pool([embedding]) for key, embedding in zip(missing.keys(), encoded)}
+        embedding_cache.set_many(model_name, new_embeddings)
+        embeddings.update(new_embeddings)
+    return [embeddings[key] for key in keys]
 
 
 def get_similar_tags(model: Union[EmbeddableModel, Query], user: User, limit: Optional[int] = None) -> models.QuerySet:
@@ -66,14 +251,144 @@ def get_similar_tags(model: Union[EmbeddableModel, Query], user: User, limit: Op
     return Tag.get_similar_objects(model.embedding, user, exclude_filter, limit)
 
 
-def get_similar_nodes(model: Union[EmbeddableModel, Query], node_class: type[NodeModel], user: User, limit: Optional[int], privacy_level: str = 'own'):
+def _get_exclude_filter(model: Union[EmbeddableModel, Query], node_class: type[NodeModel]) -> Optional[Q]:
     if isinstance(model, Tag):
-        exclude_filter = Q(tags=model) if issubclass(node_class, TaggableModel) else None
+        return Q(tags=model) if issubclass(node_class, TaggableModel) else None
     elif isinstance(model, NodeModel):
-        exclude_filter = model.related_nodes_filter(node_class)
+        return model.related_nodes_filter(node_class)
     elif isinstance(model, Query):
-        exclude_filter = None
-    else:
-        raise NotImplementedError()
+        return None
+    raise NotImplementedError()
+
+
+def get_similar_nodes(model: Union[EmbeddableModel, Query], node_class: type[NodeModel], user: User, limit: Optional[int], privacy_level: str = 'own'):
+    exclude_filter = _get_exclude_filter(model, node_class)
     return node_class.get_similar_objects(model.embedding, user, exclude_filter, limit, privacy_level=privacy_level)
 
+
+def get_similar_nodes_across(model: Union[EmbeddableModel, Query], node_classes: list[type[NodeModel]], user: User, limit: int, privacy_level: str = 'own') -> list[NodeModel]:
+    """
+    Return the top `limit` nodes of any of the given classes, nearest first, ranked by a single UNION ALL query.
+    Each returned object has its cosine distance to `model` set as `distance`.
+    """
+    return load_ranked_objects(rank_similar_nodes_across(model, node_classes, user, limit, privacy_level))
+
+
+def rank_similar_nodes_across(model: Union[EmbeddableModel, Query], node_classes: list[type[NodeModel]], user: User, limit: int, privacy_level: str = 'own') -> list[tuple[int, int, float]]:
+    """
+    The (content_type_id, pk, distance) rows of get_similar_nodes_across, without loading the objects.
+    """
+    querysets = [
+        node_class.get_similar_object_distances(model.embedding, user, _get_exclude_filter(model, node_class), limit, privacy_level=privacy_level)
+        for node_class in node_classes
+    ]
+    return list(querysets[0].union(*querysets[1:], all=True).order_by('distance')[:limit])
+
+
+def load_ranked_objects(rows: list[tuple[int, int, float]], with_content: bool = False) -> list[EmbeddableModel]:
+    """
+    Turn (content_type_id, pk, distance) rows into model instances, in the same order, with one query per model.
+    """
+    pks_by_content_type = defaultdict(list)
+    for content_type_id, pk, _distance in rows:
+        pks_by_content_type[content_type_id].append(pk)
+    objects_by_content_type = dict()
+    for content_type_id, pks in pks_by_content_type.items():
+        queryset = ContentType.objects.get_for_id(content_type_id).model_class().objects.all() # type: ignore
+        if with_content:
+            queryset = queryset.with_heavy_fields('content')
+        objects_by_content_type[content_type_id] = queryset.in_bulk(pks)
+    ranked_objects = []
+    for content_type_id, pk, distance in rows:
+        obj = objects_by_content_type[content_type_id].get(pk)
+        if obj is None:
+            continue
+        obj.distance = distance
+        ranked_objects.append(obj)
+    return ranked_objects
+
+
+def get_similar_passages(model: Union[EmbeddableModel, Query], node_classes: list[type[NodeModel]], user: User, limit: int, privacy_level: str = 'own') -> list[NodeModel]:
+    """
+    Return the top `limit` nodes of the given classes, ranked by their best-matching chunk instead of their document embedding.
+    Each returned object has that chunk's cosine distance set as `distance`, and its text as `passage` (None if the title matched best).
+    """
+    return load_ranked_passages(rank_similar_passages(model, node_classes, user, limit, privacy_level))
+
+
+def rank_similar_passages(model: Union[EmbeddableModel, Query], node_classes: list[type[NodeModel]], user: User, limit: int, privacy_level: str = 'own') -> list[tuple[int, int, float, Optional[int], Optional[int]]]:
+    """
+    The (content_type_id, pk, distance, start, end) rows of get_similar_passages, without loading the objects.
+    """
+    visible = Q()
+    for node_class in node_classes:
+        nodes = node_class._scope_similar_objects(node_class.objects.all(), user, _get_exclude_filter(model, node_class), None, privacy_level)
+        visible |= Q(content_type=ContentType.objects.get_for_model(node_class), object_id__in=nodes.values('pk'))
+    # Most of the chunks nearest to the query may belong to other users, other versions or excluded nodes
+    chunks = (NodeChunk.objects
+              .with_filtered_search_settings(limit * PASSAGE_OVERSAMPLE)
+              .filter(visible, version=settings.EMBEDDING_MODEL_VERSION)
+              .annotate(distance=cosine_distance(model.embedding))
+              .filter(distance__lt=0.6)
+              .order_by('distance')
+              .values_list('content_type_id', 'object_id', 'start', 'end', 'distance'))[:limit * PASSAGE_OVERSAMPLE]
+
+    best_chunks = dict()
+    for content_type_id, object_id, start, end, distance in chunks:
+        best_chunks.setdefault((content_type_id, object_id), (distance, start, end))
+    return [(content_type_id, object_id, *chunk) for (content_type_id, object_id), chunk in best_chunks.items()][:limit]
+
+
+def load_ranked_passages(rows: list[tuple[int, int, float, Optional[int], Optional[int]]]) -> list[EmbeddableModel]:
+    """
+    Turn rank_similar_passages rows into model instances, in the same order, with their passage set.
+    """
+    spans = {(content_type_id, pk): (start, end) for content_type_id, pk, _distance, start, end in rows}
+    objects = load_ranked_objects([row[:3] for row in rows], with_content=True)
+    for obj in objects:
+        start, end = spans[(ContentType.objects.get_for_model(obj).pk, obj.pk)]
+        obj.passage = obj.content[start:end] if start is not None else None # type: ignore
+    return objects
+
+
+def rank_text_matches(query: str, node_classes: list[type[TitleAndContentModel]], user: User, limit: int, privacy_level: str = 'own') -> list[tuple[int, int, float]]:
+    """
+    (content_type_id, pk, text_rank) rows of the top `limit` nodes of the given classes whose title or content match
+    the words of `query`, best match first. See TitleAndContentModel.text_search.
+    """
+    querysets = []
+    for node_class in node_classes:
+        content_type = ContentType.objects.get_for_model(node_class)
+        visible = node_class._scope_similar_objects(node_class.objects.all(), user, None, None, privacy_level) # type: ignore
+        querysets.append(node_class.text_search(visible, query)
+                         .annotate(content_type_id=models.Value(content_type.pk, output_field=models.IntegerField()))
+                         .values_list('content_type_id', 'pk', 'text_rank')[:limit])
+    if len(querysets) == 1:
+        return list(querysets[0])
+    return list(querysets[0].union(*querysets[1:], all=True).order_by('-text_rank')[:limit])
+
+
+def fuse_rankings(*rankings: list[tuple], k: int = RRF_K) -> list[tuple[tuple, float]]:
+    """
+    Reciprocal rank fusion of rankings of the same kind of keys: each key scores the sum of 1 / (k + rank) over the
+    rankings it appears in. Only ranks count, so rankings with incomparable scores (text ranks and cosine distances)
+    can be combined, and keys ranked well by several rankings come first. Returns (key, score) pairs, best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def rank_hybrid_search(query: Query, node_classes: list[type[NodeModel]], user: User, limit: int, privacy_level: str = 'own') -> list[tuple[int, int, float, Optional[int], Optional[int]]]:
+    """
+    Rows like rank_similar_passages', fusing its ranking of the best passages with the ranking of full-text matches of
+    the query's words, so that exact keyword matches are found even when their embeddings aren't near the query's.
+    The fused score, higher is better, takes the place of the distance. Nodes only found by their words have no passage.
+    """
+    passages = rank_similar_passages(query, node_classes, user, limit, privacy_level)
+    matches = rank_text_matches(query.query, node_classes, user, limit, privacy_level) # type: ignore
+    spans = {(content_type_id, pk): (start, end) for content_type_id, pk, _distance, start, end in passages}
+    fused = fuse_rankings([row[:2] for row in passages], [row[:2] for row in matches])
+    return [(content_type_id, pk, score, *spans.get((content_type_id, pk), (None, None))) for (content_type_id, pk), score in fused[:limit]]
@@ -12,10 +12,7 @@ class BaseNodeFilter(django_filters.FilterSet):
         fields = []
 
     def filter_search(self, queryset, name, value):
-        return queryset.filter(
-            models.Q(title__icontains=value) |
-            models.Q(content__icontains=value)
-        )
+        return queryset.model.text_search(queryset, value, match_title_substrings=True)
 
 class ReferenceFilter(BaseNodeFilter):
     class Meta(BaseNodeFilter.Meta):
@@ -30,6 +27,8 @@ class MemoFilter(BaseNodeFilter):
     class Meta(BaseNodeFilter.Meta):
         model = Memo
 
+# The icontains filters below are backed by the trigram indexes of migration 0016_trigram_indexes
+
 class LinkTypeFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     reverse_name = django_filters.CharFilter(lookup_expr='icontains')
@@ -47,12 +46,12 @@ class LinkFilter(django_filters.FilterSet):
         fields = []
 
     def filter_search(self, queryset, name, value):
-        # Split value to search for link_type name and object name separately
+        # Every condition is on a single table, so that each can use its index
+        link_types = LinkType.objects.filter(models.Q(name__icontains=value) | models.Q(reverse_name__icontains=value))
         lookups = (
-            models.Q(link_type__name__icontains=value) |
-            models.Q(link_type__reverse_name__icontains=value) |
-            models.Q(source_content_object__title__icontains=value) |
-            models.Q(target_content_object__title__icontains=value)
+            models.Q(link_type__in=link_types) |
+            models.Q(source_title__icontains=value) |
+            models.Q(target_title__icontains=value)
         )
         return queryset.filter(lookups)
     
@@ -0,0 +1,106 @@
+import json
+import math
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core import signing
+from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Coalesce, Exp
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import TimelineEntry, User, cosine_distance
+from .timeline import TAB_DISTANCES, TIMELINE_CLASSES
+
+
+class EpochSeconds(models.Func):
+    """
+    Length of an interval in seconds.
+    """
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)::double precision'
+    output_field = models.FloatField()
+
+
+def feed_score(as_of: datetime, intention_embedding) -> models.Expression:
+    """
+    How high an object ranks in the home feed as of `as_of`: its recency, which halves every
+    settings.HOME_FEED_HALF_LIFE_HOURS since it was last updated, blended with the cosine similarity of its embedding
+    to the user's intention (counted as 0 for objects without one) by settings.HOME_FEED_INTENTION_WEIGHT.
+    """
+    age_hours = EpochSeconds(models.Value(as_of) - models.F('updated_at')) / 3600
+    recency = Exp(age_hours * (-math.log(2) / settings.HOME_FEED_HALF_LIFE_HOURS))
+    if intention_embedding is None:
+        return recency
+    similarity = Coalesce(1 - cosine_distance(intention_embedding), 0.0, output_field=models.FloatField())
+    weight = settings.HOME_FEED_INTENTION_WEIGHT
+    return (1 - weight) * recency + weight * similarity
+
+
+def rank_home_feed(user: User, privacy_level: str, cursor: Optional[str], limit: int) -> tuple[list[tuple[int, int, float]], Optional[str]]:
+    """
+    One page of the user's home feed tab: (content_type_id, pk, score) rows, best first, and the cursor of the next page
+    (None on the last page). The page starts after the row `cursor` points at, or at the top without a (valid) cursor.
+
+    Each class's settings.HOME_FEED_CANDIDATES most recent entries in the user's timeline (see app.timeline), read with a
+    range scan of its index however many friends the user has, are scored with feed_score() and ranked in a single
+    query. The candidates still go through the privacy filter, so entries that the timeline worker hasn't caught up with
+    yet never show objects the user can no longer see. Scores are computed as of the time the first page was loaded,
+    which the cursor carries, so they don't drift while the user scrolls.
+    """
+    position = _decode_cursor(cursor) if cursor else None
+    as_of = position['as_of'] if position else timezone.now()
+    score = feed_score(as_of, user.intention_embedding)
+    querysets = []
+    for feed_class in TIMELINE_CLASSES:
+        content_type_id = ContentType.objects.get_for_model(feed_class).pk
+        candidates = (TimelineEntry.objects
+                      .filter(viewer=user, content_type_id=content_type_id, privacy_level__lte=TAB_DISTANCES[privacy_level], ts__lte=as_of)
+                      .order_by('-ts')
+                      .values('object_id')[:settings.HOME_FEED_CANDIDATES])
+        queryset = (feed_class.objects
+                    .filter(feed_class.get_privacy_filter(user, privacy_level), pk__in=candidates, updated_at__lte=as_of)
+                    .annotate(score=score))
+        if position:
+            queryset = queryset.filter(_after(position, content_type_id))
+        querysets.append(queryset
+                         .annotate(content_type_id=models.Value(content_type_id, output_field=models.IntegerField()))
+                         .values_list('content_type_id', 'pk', 'score')
+                         .order_by('-score', '-pk')[:limit + 1])
+    rows = list(querysets[0].union(*querysets[1:], all=True).order_by('-score', 'content_type_id', '-pk')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    content_type_id, pk, score = rows[-1]
+    return rows, _encode_cursor(dict(as_of=as_of, score=score, content_type_id=content_type_id, pk=pk))
+
+
+def _after(position: dict, content_type_id: int) -> Q:
+    """
+    Objects of the content type that come after `position` in the order of score (descending), content type, then pk (descending).
+    """
+    if content_type_id < position['content_type_id']:
+        return Q(score__lt=position['score'])
+    if content_type_id > position['content_type_id']:
+        return Q(score__lte=position['score'])
+    return Q(score__lt=position['score']) | Q(score=position['score'], pk__lt=position['pk'])
+
+
+def _encode_cursor(position: dict) -> str:
+    return signing.dumps(json.dumps(position, default=str), salt='home_feed')
+
+
+def _decode_cursor(cursor: str) -> Optional[dict]:
+    try:
+        position = json.loads(signing.loads(cursor, salt='home_feed'))
+        position['as_of'] = parse_datetime(position['as_of'])
+        if position['as_of'] is None:
+            return None
+        position['score'] = float(position['score'])
+        position['content_type_id'] = int(position['content_type_id'])
+        position['pk'] = int(position['pk'])
+        return position
+    except (signing.BadSignature, ValueError, KeyError, TypeError):
+        return None
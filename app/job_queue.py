@@ -0,0 +1,46 @@
+from datetime import timedelta
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QueuedJob
+
+# How long a claimed job stays hidden from other workers before it is retried
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+
+def claim_jobs(job_class: type[QueuedJob], batch_size: int) -> list[QueuedJob]:
+    """
+    Lease up to batch_size available jobs. Jobs claimed by other workers are skipped rather than waited on.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(job_class.objects
+                    .select_for_update(skip_locked=True)
+                    .filter(available_at__lte=now)
+                    .order_by('available_at')[:batch_size])
+        lease_until = now + CLAIM_LEASE
+        job_class.objects.filter(pk__in=[job.pk for job in jobs]).update(available_at=lease_until, attempts=F('attempts') + 1)
+    for job in jobs:
+        job.available_at = lease_until
+    return jobs
+
+
+def complete_jobs(jobs: list[QueuedJob]):
+    """
+    Delete finished jobs, unless they were re-queued while being processed: those must run again.
+    """
+    if not jobs:
+        return
+    leases = {job.available_at for job in jobs}
+    type(jobs[0]).objects.filter(pk__in=[job.pk for job in jobs], available_at__in=leases).delete()
+
+
+def retry_jobs_later(jobs: list[QueuedJob], delay: Optional[timedelta] = None, error: str = ''):
+    now = timezone.now()
+    for job in jobs:
+        job_delay = delay if delay is not None else min(MAX_RETRY_DELAY, timedelta(seconds=2 ** job.attempts))
+        type(job).objects.filter(pk=job.pk, available_at=job.available_at).update(available_at=now + job_delay, last_error=error)
@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from app.embedding_backends import get_local_backend
+from app.models import Memo
+
+SAMPLE_TEXTS = [
+    "Spaced repetition works because recall strengthens memory more than rereading does.",
+    "What is the difference between a hypothesis and a theory?",
+    "Notes on the history of the printing press in fifteenth-century Europe",
+    "Supports",
+    "The quick brown fox jumps over the lazy dog.",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare the embeddings of two backends (by default onnx against torch) and time them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='onnx')
+        parser.add_argument('--reference', default='torch')
+        parser.add_argument('--tolerance', type=float, default=0.01, help="Largest allowed cosine distance between the two backends' embeddings.")
+        parser.add_argument('--memos', type=int, default=200, help="Also compare this many memos from the database.")
+
+    def handle(self, *args, **options):
+        texts = SAMPLE_TEXTS + [memo.content for memo in Memo.objects.only('content')[:options['memos']] if memo.content]
+        backend = get_local_backend(options['backend'])
+        reference = get_local_backend(options['reference'])
+
+        embeddings, backend_seconds = self._time(backend, texts)
+        reference_embeddings, reference_seconds = self._time(reference, texts)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        reference_embeddings = reference_embeddings / np.linalg.norm(reference_embeddings, axis=1, keepdims=True)
+        distances = 1 - np.sum(embeddings * reference_embeddings, axis=1)
+
+        self.stdout.write(f"{len(texts)} texts: {options['backend']} {backend_seconds:.2f}s, {options['reference']} {reference_seconds:.2f}s "
+                          f"({reference_seconds / backend_seconds:.1f}x)")
+        self.stdout.write(f"Cosine distance: mean {distances.mean():.5f}, max {distances.max():.5f}")
+        if distances.max() > options['tolerance']:
+            raise CommandError(f"{int((distances > options['tolerance']).sum())} embeddings differ by more than {options['tolerance']}")
+
+    @staticmethod
+    def _time(backend, texts: list[str]) -> tuple[np.ndarray, float]:
+        backend.load_model()
+        start = time.perf_counter()
+        embeddings = backend.encode(texts)
+        return np.asarray(embeddings, dtype=np.float32), time.perf_counter() - start
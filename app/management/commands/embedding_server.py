@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.embedding_backends import get_local_backend
+from app.embedding_server import serve
+
+
+class Command(BaseCommand):
+    help = "Serve embeddings over localhost HTTP from a single copy of the model, batching concurrent requests together."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--max-wait', type=float, default=0.01, help="Seconds to wait for other requests to join a batch.")
+        parser.add_argument('--max-chunks', type=int, default=256, help="Start encoding once this many chunks are waiting.")
+
+    def handle(self, *args, **options):
+        backend = get_local_backend()
+        backend.load_model()
+        self.stdout.write(f"Serving embeddings on http://{options['host']}:{options['port']}")
+        serve(backend, options['host'], options['port'], options['max_wait'], options['max_chunks'])
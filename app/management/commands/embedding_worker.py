@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.embedding_queue import process_embedding_jobs
+
+
+class Command(BaseCommand):
+    help = "Compute queued embeddings, encoding the texts of many objects together."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64, help="Maximum number of jobs to claim and encode at once.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processed = process_embedding_jobs(options['batch_size'])
+            except Exception as e:
+                self.stderr.write(f"Embedding batch failed: {e!r}")
+                processed = 0
+            if processed:
+                self.stdout.write(f"Processed {processed} embedding jobs")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,50 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Export the sentence-transformers encoder to ONNX and quantize its weights to int8, for EMBEDDING_BACKEND = 'onnx'."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=settings.EMBEDDING_MODEL_NAME)
+        parser.add_argument('--output', default=str(settings.EMBEDDING_ONNX_DIR))
+        parser.add_argument('--opset', type=int, default=17)
+
+    def handle(self, *args, **options):
+        # Export needs torch; only running the exported model avoids it
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from sentence_transformers import SentenceTransformer
+
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+        model = SentenceTransformer(options['model'], device='cpu')
+        transformer = model[0].auto_model.eval()
+        tokenizer = model.tokenizer
+        tokenizer.save_pretrained(output)
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.transformer(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+
+        example = tokenizer(["An example sentence to trace the encoder with."], return_tensors='pt')
+        full_precision_path = os.path.join(output, 'model.onnx')
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState(),
+                (example['input_ids'], example['attention_mask'], example['token_type_ids']),
+                full_precision_path,
+                input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+                output_names=['last_hidden_state'],
+                dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in ['input_ids', 'attention_mask', 'token_type_ids', 'last_hidden_state']},
+                opset_version=options['opset'],
+                dynamo=False,
+            )
+        quantize_dynamic(full_precision_path, os.path.join(output, 'model_quantized.onnx'), weight_type=QuantType.QInt8)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}/model_quantized.onnx; check it with manage.py check_embedding_backend"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.reembedding import activate, backfill, count_pending
+
+
+class Command(BaseCommand):
+    help = ("Re-embed everything with the model version in settings.EMBEDDING_MODEL_VERSION. "
+            "Without --activate, stages the new embeddings while search keeps using the live ones, resuming where a previous run stopped. "
+            "With --activate, swaps the staged embeddings in.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=128)
+        parser.add_argument('--workers', type=int, default=1, help="Processes to encode with.")
+        parser.add_argument('--activate', action='store_true', help="Make the staged embeddings live.")
+        parser.add_argument('--force', action='store_true', help="Activate even if some objects haven't been staged.")
+
+    def handle(self, *args, **options):
+        if not options['activate']:
+            backfill(options['batch_size'], options['workers'], log=self.stdout.write)
+
+        pending = {label: count for label, count in count_pending().items() if count}
+        for label, count in pending.items():
+            self.stdout.write(f"{label}: {count} not staged yet")
+
+        if not options['activate']:
+            self.stdout.write(self.style.SUCCESS("Backfill finished. Run again to pick up new objects, then with --activate."))
+            return
+        if pending and not options['force']:
+            raise CommandError("Some objects have no staged embedding: run the backfill again first, or pass --force.")
+        queued = activate(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Activated; queued {queued} objects edited since they were staged."))
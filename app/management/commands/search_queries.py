@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import QueryEmbedding
+
+
+class Command(BaseCommand):
+    help = "List the most popular search queries of the current embedding model, and optionally drop expired query embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="How many queries to list.")
+        parser.add_argument('--prune', action='store_true', help="Delete query embeddings older than settings.QUERY_EMBEDDING_TTL.")
+
+    def handle(self, *args, **options):
+        queries = QueryEmbedding.objects.filter(model_name=settings.EMBEDDING_MODEL_VERSION)
+        for query, hits, last_used_at in queries.order_by('-hits').values_list('query', 'hits', 'last_used_at')[:options['top']]:
+            self.stdout.write(f"{hits:8d}  {last_used_at:%Y-%m-%d %H:%M}  {query}")
+        self.stdout.write(f"{queries.count()} queries cached")
+
+        if options['prune']:
+            expired_before = timezone.now() - timedelta(seconds=settings.QUERY_EMBEDDING_TTL)
+            deleted, _ = QueryEmbedding.objects.filter(encoded_at__lte=expired_before).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired query embeddings."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.timeline import process_timeline_jobs
+
+
+class Command(BaseCommand):
+    help = "Write saved nodes and links to the home feed timelines of their audience, and rebuild the timelines of users whose friendships changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256, help="Maximum number of jobs to claim at once.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processed = process_timeline_jobs(options['batch_size'])
+            except Exception as e:
+                self.stderr.write(f"Timeline batch failed: {e!r}")
+                processed = 0
+            if processed:
+                self.stdout.write(f"Processed {processed} timeline jobs")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:38
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+import pgvector.django.indexes
+
+
+class Migration(migrations.Migration):
+    # HNSW builds are slow on large tables, so build them without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('app', '0003_user_friends_user_intention_user_intention_embedding_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='inkling_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='link',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='link_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='memo_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='reference_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='tag_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_REACH_SQL = """
+INSERT INTO app_userreach (viewer_id, owner_id, distance)
+SELECT from_user_id, to_user_id, 1 FROM app_user_friends;
+
+INSERT INTO app_userreach (viewer_id, owner_id, distance)
+SELECT DISTINCT direct.from_user_id, indirect.to_user_id, 2
+FROM app_user_friends direct
+JOIN app_user_friends indirect ON indirect.from_user_id = direct.to_user_id
+WHERE indirect.to_user_id <> direct.from_user_id
+  AND NOT EXISTS (
+    SELECT 1 FROM app_user_friends friend
+    WHERE friend.from_user_id = direct.from_user_id AND friend.to_user_id = indirect.to_user_id
+  );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_embedding_hnsw_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserReach',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveSmallIntegerField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audience', to=settings.AUTH_USER_MODEL)),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reach', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['viewer', 'distance', 'owner'], name='userreach_viewer_distance_idx')],
+                'unique_together': {('viewer', 'owner')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_REACH_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+
+
+# Queue every node for the embedding worker, which stores its chunks as it re-embeds it
+QUEUE_NODES_SQL = """
+INSERT INTO app_embeddingjob (created_at, updated_at, content_type_id, object_id, available_at, attempts, last_error)
+SELECT now(), now(), content_type.id, node.id, now(), 0, ''
+FROM django_content_type content_type
+JOIN (
+    SELECT 'memo' AS model, id FROM app_memo
+    UNION ALL SELECT 'reference', id FROM app_reference
+    UNION ALL SELECT 'inkling', id FROM app_inkling
+) node ON node.model = content_type.model
+WHERE content_type.app_label = 'app'
+ON CONFLICT (content_type_id, object_id) DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('app', '0007_cachedembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('start', models.PositiveIntegerField(null=True)),
+                ('end', models.PositiveIntegerField(null=True)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='nodechunk_embedding_idx', opclasses=['vector_cosine_ops'])],
+                'unique_together': {('content_type', 'object_id', 'position')},
+            },
+        ),
+        migrations.RunSQL(QUEUE_NODES_SQL, migrations.RunSQL.noop),
+    ]
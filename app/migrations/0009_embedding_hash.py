@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_nodechunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inkling',
+            name='embedding_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='embedding_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='memo',
+            name='embedding_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='reference',
+            name='embedding_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='embedding_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
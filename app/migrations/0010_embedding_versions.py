@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import pgvector.django.vector
+
+
+def tag_existing_embeddings(apps, schema_editor):
+    # Everything embedded so far was embedded by the current model
+    version = settings.EMBEDDING_MODEL_VERSION
+    for model_name in ['Inkling', 'Link', 'Memo', 'Reference', 'Tag']:
+        apps.get_model('app', model_name).objects.filter(embedding__isnull=False).update(embedding_version=version)
+    apps.get_model('app', 'User').objects.filter(intention_embedding__isnull=False).update(intention_embedding_version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('app', '0009_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='nodechunk',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='inkling',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='memo',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='nodechunk',
+            name='version',
+            field=models.CharField(default=settings.EMBEDDING_MODEL_VERSION, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reference',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='intention_embedding_version',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodechunk',
+            unique_together={('version', 'content_type', 'object_id', 'position')},
+        ),
+        migrations.CreateModel(
+            name='StagedEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=255)),
+                ('object_id', models.PositiveIntegerField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+                ('embedding_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'unique_together': {('version', 'content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(tag_existing_embeddings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:13
+
+import app.models
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations
+import pgvector.django.bit
+import pgvector.django.halfvec
+import pgvector.django.indexes
+
+
+def check_pgvector_version(apps, schema_editor):
+    # halfvec and binary_quantize need pgvector 0.7 or later. Upgrading the extension is left to whoever owns it.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    version = tuple(int(part) for part in row[0].split('.')[:2]) if row else None
+    if version is None or version < (0, 7):
+        raise RuntimeError(
+            f"pgvector 0.7 or later is required, but the installed version is {row[0] if row else 'none'}. "
+            "Upgrade it with ALTER EXTENSION vector UPDATE as the extension's owner, then migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+    # The full precision indexes are only dropped once the smaller ones are built, so search stays indexed throughout
+    atomic = False
+
+    dependencies = [
+        ('app', '0010_embedding_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_pgvector_version, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='inkling_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='inkling_embedding_bit_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='link',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='link_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='link',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='link_embedding_bit_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='memo_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='memo_embedding_bit_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='nodechunk',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='nodechunk_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='nodechunk',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='nodechunk_embedding_bit_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='reference_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='reference_embedding_bit_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('embedding', pgvector.django.halfvec.HalfVectorField(dimensions=384)), name='halfvec_cosine_ops'), ef_construction=64, m=16, name='tag_embedding_half_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=pgvector.django.indexes.HnswIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast(app.models.BinaryQuantize('embedding'), pgvector.django.bit.BitField(length=384)), name='bit_hamming_ops'), ef_construction=64, m=16, name='tag_embedding_bit_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='inkling',
+            name='inkling_embedding_hnsw_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='link',
+            name='link_embedding_hnsw_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='memo',
+            name='memo_embedding_hnsw_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='nodechunk',
+            name='nodechunk_embedding_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='reference',
+            name='reference_embedding_hnsw_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='tag',
+            name='tag_embedding_hnsw_idx',
+        ),
+    ]
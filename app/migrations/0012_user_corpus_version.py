@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_quantized_embedding_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='corpus_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:25
+
+from django.db import migrations, models
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_user_corpus_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=255)),
+                ('key', models.CharField(max_length=64)),
+                ('query', models.TextField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+                ('encoded_at', models.DateTimeField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('model_name', 'key')},
+            },
+        ),
+    ]
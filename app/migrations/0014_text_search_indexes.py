@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Built without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('app', '0013_query_embedding'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('content', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), name='inkling_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('content', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), name='memo_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='english', weight='A'), '||', django.contrib.postgres.search.SearchVector('content', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('english')), name='reference_search_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:30
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def copy_endpoint_titles(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Link = apps.get_model('app', 'Link')
+    for model_name in ['memo', 'reference', 'inkling']:
+        content_type = ContentType.objects.filter(app_label='app', model=model_name).first()
+        if content_type is None:
+            continue
+        node_class = apps.get_model('app', model_name)
+        for end in ['source', 'target']:
+            title = node_class.objects.filter(pk=models.OuterRef(f'{end}_object_id')).values('title')[:1]
+            Link.objects.filter(**{f'{end}_content_type': content_type}).update(**{f'{end}_title': Coalesce(models.Subquery(title), models.Value(''))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_text_search_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='source_title',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='target_title',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(copy_endpoint_titles, migrations.RunPython.noop),
+    ]
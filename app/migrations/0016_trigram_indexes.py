@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# (index name, table, column) of the trigram indexes. They index UPPER(column), the expression icontains
+# filters compare, so those filters can use them
+TRIGRAM_INDEXES = [
+    ('memo_title_trgm_idx', 'app_memo', 'title'),
+    ('reference_title_trgm_idx', 'app_reference', 'title'),
+    ('inkling_title_trgm_idx', 'app_inkling', 'title'),
+    ('tag_name_trgm_idx', 'app_tag', 'name'),
+    ('linktype_name_trgm_idx', 'app_linktype', 'name'),
+    ('linktype_reverse_name_trgm_idx', 'app_linktype', 'reverse_name'),
+    ('link_source_title_trgm_idx', 'app_link', 'source_title'),
+    ('link_target_title_trgm_idx', 'app_link', 'target_title'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        # pg_trgm is a contrib module, which not every postgres installation ships. Without it the
+        # icontains filters still work, only without an index
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name, _table, _column in TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    # Built without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('app', '0015_link_endpoint_titles'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
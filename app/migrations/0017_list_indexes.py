@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:34
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('app', '0016_trigram_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='inkling_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=models.Index(fields=['user', 'title', 'id'], name='inkling_user_title_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='memo_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=models.Index(fields=['user', 'title', 'id'], name='memo_user_title_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='reference_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=models.Index(fields=['user', 'title', 'id'], name='reference_user_title_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('app', '0017_list_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inkling',
+            index=models.Index(fields=['-updated_at', '-id'], name='inkling_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='link',
+            index=models.Index(fields=['-updated_at', '-id'], name='link_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='memo',
+            index=models.Index(fields=['-updated_at', '-id'], name='memo_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reference',
+            index=models.Index(fields=['-updated_at', '-id'], name='reference_updated_idx'),
+        ),
+    ]
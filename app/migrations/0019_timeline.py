@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def enqueue_timeline_rebuilds(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    User = apps.get_model('app', 'User')
+    TimelineJob = apps.get_model('app', 'TimelineJob')
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    if not user_ids:
+        return
+    content_type, _ = ContentType.objects.get_or_create(app_label='app', model='user')
+    TimelineJob.objects.bulk_create([TimelineJob(content_type=content_type, object_id=user_id) for user_id in user_ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('app', '0018_recency_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['available_at'], name='timelinejob_available_idx')],
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('privacy_level', models.PositiveSmallIntegerField()),
+                ('ts', models.DateTimeField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['viewer', 'content_type', '-ts'], name='timelineentry_viewer_ts_idx'), models.Index(fields=['content_type', 'object_id'], name='timelineentry_object_idx')],
+                'unique_together': {('viewer', 'content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(enqueue_timeline_rebuilds, migrations.RunPython.noop),
+    ]
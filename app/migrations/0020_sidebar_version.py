@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='sidebar_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
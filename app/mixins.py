@@ -3,12 +3,10 @@ from django.db.models import Q
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 
-from app.embeddings import generate_embedding
 from app.prompting import ChatGPT, Completer, get_generated_metadata
 
-from .models import (EmbeddableModel, NodeModel, PrivacySettingsModel,
-                     SummarizableModel, TaggableModel, TitleAndContentModel,
-                     UserOwnedModel)
+from .models import (NodeModel, PrivacySettingsModel, SummarizableModel,
+                     TaggableModel, TitleAndContentModel, UserOwnedModel)
 
 
 def add_metadata(object: UserOwnedModel, completer: Completer):
@@ -27,8 +25,6 @@ def add_metadata(object: UserOwnedModel, completer: Completer):
         summary = ai_content.get('summary')
         if summary:
             object.summary = summary
-    if isinstance(object, EmbeddableModel):
-        object.embedding = generate_embedding(object.content, object.title) # type: ignore
     object.save()
     if isinstance(object, TaggableModel):
         tags = ai_content.get('tags', list())
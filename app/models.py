@@ -1,18 +1,28 @@
+import hashlib
+import itertools
 import uuid
 from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Optional
 
 import numpy as np
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.contenttypes.fields import (GenericForeignKey,
                                                 GenericRelation)
 from django.contrib.contenttypes.models import ContentType
-from django.db import models, transaction
-from django.db.models import Q
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections, models, transaction
+from django.db.models import Prefetch, Q, Value, prefetch_related_objects
+from django.db.models.functions import Cast
 from django.urls import reverse
+from django.utils import timezone
 from martor.models import MartorField
-from pgvector.django import CosineDistance, VectorField
+from pgvector.django import (BitField, CosineDistance, HalfVectorField,
+                             HammingDistance, HnswIndex, VectorField)
 
 
 class TimeStampedModel(models.Model):
@@ -28,6 +38,12 @@ class User(AbstractUser, TimeStampedModel):
     friends = models.ManyToManyField('self', blank=True, symmetrical=True)
     intention = models.TextField(blank=True, null=True)
     intention_embedding = VectorField(dimensions=384, null=True)
+    intention_embedding_version = models.CharField(max_length=255, blank=True, default='')
+    # Changes whenever the user's content or reach changes. Cached feeds are keyed by it and by the corpus_versions of
+    # the owners the user reaches (see views.feed.get_corpus_version), so feeds of older versions are stale
+    corpus_version = models.PositiveIntegerField(default=0)
+    # Changes whenever the user's memos, references or tags change; cached sidebar pages of older versions are stale
+    sidebar_version = models.PositiveIntegerField(default=0)
 
     class Meta:
         abstract = False
@@ -38,18 +54,31 @@ class User(AbstractUser, TimeStampedModel):
 
     def accept_friend_request(self, sender: 'User'):
         if sender.has_sent_request_to(self):
-            self.friends.add(sender)
-            sender.friends.add(self)
-            FriendRequest.objects.filter(sender=sender, receiver=self).delete()
+            with transaction.atomic():
+                self.friends.add(sender)
+                sender.friends.add(self)
+                FriendRequest.objects.filter(sender=sender, receiver=self).delete()
+                self._refresh_reach_around(sender)
 
     def reject_friend_request(self, sender: 'User'):
         FriendRequest.objects.filter(sender=sender, receiver=self).delete()
 
     def remove_friend(self, friend: 'User'):
-        self.friends.remove(friend)
+        with transaction.atomic():
+            self.friends.remove(friend)
+            self._refresh_reach_around(friend)
+
+    def _refresh_reach_around(self, other: 'User'):
+        """
+        A friendship between two users can only change the reach of those two users and of their direct friends.
+        """
+        affected_ids = {self.pk, other.pk}
+        affected_ids.update(self.friends.values_list('pk', flat=True))
+        affected_ids.update(other.friends.values_list('pk', flat=True))
+        UserReach.refresh_for(affected_ids)
 
     def is_friends_with(self, friend: 'User'):
-        return friend in self.friends.all()
+        return self.friends.filter(pk=friend.pk).exists()
 
     def has_sent_request_to(self, receiver: 'User'):
         return FriendRequest.objects.filter(sender=self, receiver=receiver).exists()
@@ -69,6 +98,65 @@ class FriendRequest(TimeStampedModel):
         return cls.objects.filter(sender=sender, receiver=receiver).exists()
 
 
+class UserReach(models.Model):
+    """
+    Materialized social distance from a viewer to the owner of some content: friends or friends of friends.
+    Kept up to date by User.accept_friend_request and User.remove_friend, and for the friends of deleted users by a
+    pre_delete receiver. Refreshing also queues a rebuild of the timelines of the viewers whose reach changed.
+    """
+    FRIEND = 1
+    FRIEND_OF_FRIEND = 2
+
+    viewer = models.ForeignKey(User, related_name="reach", on_delete=models.CASCADE)
+    owner = models.ForeignKey(User, related_name="audience", on_delete=models.CASCADE)
+    distance = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['viewer', 'owner']
+        indexes = [models.Index(fields=['viewer', 'distance', 'owner'], name='userreach_viewer_distance_idx')]
+
+    @classmethod
+    def owners_at(cls, viewer: User, distance: int) -> models.QuerySet:
+        return cls.objects.filter(viewer=viewer, distance=distance).values('owner')
+
+    @classmethod
+    def refresh_for(cls, viewer_ids: set[int]):
+        """
+        Recompute every reach row of the given viewers from the friends table.
+        """
+        friendships = User.friends.through.objects
+        friends = defaultdict(set)
+        for viewer_id, friend_id in friendships.filter(from_user_id__in=viewer_ids).values_list('from_user_id', 'to_user_id'):
+            friends[viewer_id].add(friend_id)
+        friends_of_friends = defaultdict(set)
+        all_friend_ids = set().union(*friends.values())
+        for friend_id, other_id in friendships.filter(from_user_id__in=all_friend_ids).values_list('from_user_id', 'to_user_id'):
+            friends_of_friends[friend_id].add(other_id)
+
+        rows = []
+        for viewer_id in viewer_ids:
+            direct = friends[viewer_id]
+            indirect = set().union(*(friends_of_friends[friend_id] for friend_id in direct)) - direct - {viewer_id}
+            rows.extend(cls(viewer_id=viewer_id, owner_id=owner_id, distance=cls.FRIEND) for owner_id in direct)
+            rows.extend(cls(viewer_id=viewer_id, owner_id=owner_id, distance=cls.FRIEND_OF_FRIEND) for owner_id in indirect)
+
+        with transaction.atomic():
+            cls.objects.filter(viewer_id__in=viewer_ids).delete()
+            cls.objects.bulk_create(rows)
+            User.objects.filter(pk__in=viewer_ids).update(corpus_version=models.F('corpus_version') + 1)
+            TimelineJob.enqueue(User(pk=viewer_id) for viewer_id in viewer_ids)
+
+
+def bump_corpus_versions(owner_ids: Iterable[int]):
+    """
+    Invalidate the cached feeds of everyone who might see the content of the given owners. Only the owners' own rows
+    are updated: the feeds of their friends and friends of friends are keyed by the versions of the owners they reach.
+    """
+    owner_ids = set(owner_ids)
+    if not owner_ids:
+        return
+    User.objects.filter(pk__in=owner_ids).update(corpus_version=models.F('corpus_version') + 1)
+
 
 class UserOwnedModel(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -99,32 +187,21 @@ class PrivacySettingsModel(UserOwnedModel):
         Determine if a model instance is viewable by the given user based on privacy settings.
         """
         # If the object belongs to the user, they can always view it
-        if self.user == user:
+        if self.user_id == user.pk: # type: ignore
             return True
 
         # If privacy is set to private, only the owner can view
         if self.privacy_setting == self.PRIVATE:
             return False
 
-        # If privacy is set to friends, check if the given user is a friend of the owner
+        # Otherwise the viewer must be within reach of the owner: friends, or friends of friends
         if self.privacy_setting == self.FRIENDS:
-            return user.is_friends_with(self.user) # type: ignore
-
-        # If privacy is set to friends of friends, check the relationship accordingly
-        if self.privacy_setting == self.FRIENDS_OF_FRIENDS:
-            # Direct friends
-            if user.is_friends_with(self.user):  # type: ignore
-                return True
-            
-            # Friends of friends
-            user_friends = user.friends.all()
-            owner_friends = self.user.friends.all() # type: ignore
-            
-            # Intersection checks for mutual friends
-            mutual_friends = set(user_friends).intersection(owner_friends)
-            return bool(mutual_friends)
-
-        return False
+            max_distance = UserReach.FRIEND
+        elif self.privacy_setting == self.FRIENDS_OF_FRIENDS:
+            max_distance = UserReach.FRIEND_OF_FRIEND
+        else:
+            return False
+        return UserReach.objects.filter(viewer=user, owner_id=self.user_id, distance__lte=max_distance).exists() # type: ignore
 
 
     @classmethod
@@ -139,15 +216,14 @@ class PrivacySettingsModel(UserOwnedModel):
         """
         Return a Q object representing objects owned by the friends of the given user.
         """
-        return Q(privacy_setting=cls.FRIENDS, user__friends=user) | Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user__friends=user)
+        return Q(privacy_setting__in=[cls.FRIENDS, cls.FRIENDS_OF_FRIENDS], user__in=UserReach.owners_at(user, UserReach.FRIEND))
 
     @classmethod
     def _get_friends_of_friends_objects_filter(cls, user) -> Q:
         """
         Return a Q object representing objects owned by the friends of friends of the given user.
         """
-        user_friends = user.friends.all()
-        return Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user__friends__in=user_friends) & ~Q(user__in=user_friends)
+        return Q(privacy_setting=cls.FRIENDS_OF_FRIENDS, user__in=UserReach.owners_at(user, UserReach.FRIEND_OF_FRIEND))
 
     @classmethod
     def get_privacy_filter(cls, user, level) -> Q:
@@ -171,10 +247,32 @@ class PrivacySettingsModel(UserOwnedModel):
 class TitleAndContentModel(models.Model):
     title = models.CharField(max_length=255)
     content = MartorField()
+    chunks = GenericRelation('NodeChunk')
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def text_search(cls, queryset: models.QuerySet, query: str, match_title_substrings: bool = False) -> models.QuerySet:
+        """
+        The objects of `queryset` whose title or content match the web search style `query` ("quoted phrases", or, -not),
+        best match first, with that match's rank annotated as `text_rank`. Matching goes through the GIN index on
+        search_document(), and ranking by cover density (with length normalization) puts title matches first.
+        With `match_title_substrings`, objects whose title contains `query` also match (through the title's trigram
+        index), so partly typed words find titles too.
+        """
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        matches = Q(search_document=search_query)
+        if match_title_substrings:
+            matches |= Q(title__icontains=query)
+        return (queryset
+                .annotate(search_document=search_document())
+                .filter(matches)
+                # ts_rank_cd is a real: as a double precision it compares exactly with the value a keyset cursor carries back
+                .annotate(text_rank=Cast(SearchRank(models.F('search_document'), search_query, cover_density=True, normalization=Value(1)),
+                                         models.FloatField()))
+                .order_by('-text_rank'))
+
 
 class SummarizableModel(models.Model):
     summary = models.CharField(max_length=1024)
@@ -196,24 +294,311 @@ class LinkType(UserOwnedModel, TimeStampedModel):
         return reverse('link_types')
 
 
+EMBEDDING_DIMENSIONS = 384
+
+
+class BinaryQuantize(models.Func):
+    function = 'binary_quantize'
+    output_field = BitField()
+
+
+def half_precision(expression) -> Cast:
+    return Cast(expression, HalfVectorField(dimensions=EMBEDDING_DIMENSIONS))
+
+
+def binary_quantized(expression) -> Cast:
+    """
+    One bit per dimension, set where the value is positive.
+    """
+    return Cast(BinaryQuantize(expression), BitField(length=EMBEDDING_DIMENSIONS))
+
+
+def query_vector(embedding) -> Cast:
+    # Cast so that functions overloaded for vector and halfvec, like binary_quantize, know which one to call
+    vector_field = VectorField(dimensions=EMBEDDING_DIMENSIONS)
+    return Cast(Value(embedding, output_field=vector_field), vector_field)
+
+
+def cosine_distance(embedding) -> CosineDistance:
+    """
+    Cosine distance from the embedding column to `embedding`, both at half precision, as the HNSW index computes it.
+    """
+    return CosineDistance(half_precision('embedding'), half_precision(query_vector(embedding)))
+
+
+def hamming_distance(embedding) -> HammingDistance:
+    """
+    Hamming distance between the binary quantizations of the embedding column and `embedding`: a coarse, cheap
+    stand-in for cosine distance that the binary HNSW index serves.
+    """
+    return HammingDistance(binary_quantized('embedding'), binary_quantized(query_vector(embedding)))
+
+
+def embedding_indexes(prefix: str) -> list[HnswIndex]:
+    """
+    Approximate nearest neighbour indexes over the embedding column: one over its half precision values for
+    cosine distance, and one over its binary quantization for Hamming distance. The column itself keeps full
+    precision; only the indexes, which have to fit in memory, store the smaller vectors (2x and 32x smaller).
+    """
+    return [
+        HnswIndex(OpClass(half_precision('embedding'), name='halfvec_cosine_ops'), name=f'{prefix}_half_idx', m=16, ef_construction=64),
+        HnswIndex(OpClass(binary_quantized('embedding'), name='bit_hamming_ops'), name=f'{prefix}_bit_idx', m=16, ef_construction=64),
+    ]
+
+
+# Text search configuration of the full-text index: English stemming and stop words
+SEARCH_CONFIG = 'english'
+
+
+def search_document() -> SearchVector:
+    """
+    Full-text document of a TitleAndContentModel, with the title's terms weighted above the content's.
+    Queries have to use this exact expression to use search_document_index().
+    """
+    return SearchVector('title', weight='A', config=SEARCH_CONFIG) + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+
+
+def search_document_index(prefix: str) -> GinIndex:
+    return GinIndex(search_document(), name=f'{prefix}_search_idx')
+
+
+def list_indexes(prefix: str) -> list[models.Index]:
+    """
+    Indexes over the orderings the list views page through by keyset, most recently updated first or by title,
+    so that any page of a user's list is found without scanning the rows before it.
+    """
+    return [
+        models.Index(fields=['user', '-updated_at', '-id'], name=f'{prefix}_user_updated_idx'),
+        models.Index(fields=['user', 'title', 'id'], name=f'{prefix}_user_title_idx'),
+    ]
+
+
+# pgvector's default hnsw.ef_search
+DEFAULT_EF_SEARCH = 40
+# The largest hnsw.ef_search pgvector accepts
+MAX_EF_SEARCH = 1000
+
+
+def recency_index(prefix: str) -> models.Index:
+    """
+    Index the home feed finds the most recently updated objects of all the users it covers with.
+    """
+    return models.Index(fields=['-updated_at', '-id'], name=f'{prefix}_updated_idx')
+
+
+class VectorSearchQuerySet(models.QuerySet):
+    """
+    QuerySet that applies pgvector search settings (hnsw.ef_search, hnsw.iterative_scan, ivfflat.probes) to its own
+    evaluation only: fetching its results, count(), exists() and iterator(). Querysets that embed it as a subquery
+    don't inherit them.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._search_settings = dict()
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._search_settings = dict(self._search_settings)
+        return clone
+
+    def with_search_settings(self, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                             iterative_scan: Optional[str] = None) -> 'VectorSearchQuerySet':
+        clone = self._chain()
+        if ef_search is not None:
+            clone._search_settings['hnsw.ef_search'] = ef_search
+        if iterative_scan:
+            clone._search_settings['hnsw.iterative_scan'] = iterative_scan
+        if probes is not None:
+            clone._search_settings['ivfflat.probes'] = probes
+        return clone
+
+    def with_heavy_fields(self, *fields: str) -> 'VectorSearchQuerySet':
+        """
+        Load the named heavy fields (by default all of the model's heavy_fields), which the default manager defers.
+        """
+        deferred, is_deferring = self.query.deferred_loading
+        if not is_deferring:
+            return self
+        return self.defer(None).defer(*(deferred - set(fields or self.model.heavy_fields)))
+
+    def with_filtered_search_settings(self, limit: int, ef_search: Optional[int] = None) -> 'VectorSearchQuerySet':
+        """
+        Search settings for an HNSW scan whose rows are filtered after the index returns them (by privacy, exclusions,
+        model version...), so that `limit` of them make it through. With settings.EMBEDDING_ITERATIVE_SCAN the scan
+        goes on until they do; otherwise it reads settings.EMBEDDING_FILTERED_EF_SEARCH rows before filtering.
+        """
+        # A strict_order iterative scan with a tiny ef_search can give up early when the graph has
+        # many duplicate or dead entries, so it never goes below pgvector's default
+        if settings.EMBEDDING_ITERATIVE_SCAN:
+            ef_search = max(ef_search or DEFAULT_EF_SEARCH, limit)
+        else:
+            ef_search = max(ef_search or DEFAULT_EF_SEARCH, limit, settings.EMBEDDING_FILTERED_EF_SEARCH)
+        return self.with_search_settings(ef_search=min(ef_search, MAX_EF_SEARCH), iterative_scan=settings.EMBEDDING_ITERATIVE_SCAN)
+
+    @contextmanager
+    def _applied_search_settings(self):
+        if not self._search_settings:
+            yield
+            return
+        # SET LOCAL only lasts until the end of the transaction, so the settings can't leak into other queries
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                for name, value in self._search_settings.items():
+                    cursor.execute("SELECT set_config(%s, %s, true)", [name, str(value)])
+            yield
+
+    def _fetch_all(self):
+        if self._result_cache is not None:
+            return super()._fetch_all()
+        with self._applied_search_settings():
+            super()._fetch_all()
+
+    def count(self) -> int:
+        with self._applied_search_settings():
+            return super().count()
+
+    def exists(self) -> bool:
+        with self._applied_search_settings():
+            return super().exists()
+
+    def iterator(self, chunk_size: Optional[int] = None):
+        with self._applied_search_settings():
+            yield from super().iterator(chunk_size)
+
+    def enqueue_stale_embeddings(self) -> int:
+        """
+        Queue the objects whose embedding is missing or was computed from different inputs than they have now,
+        and return how many were queued. Saving an object does this already; call it after update(), bulk_create()
+        or bulk_update() on embedded fields.
+        """
+        # Staleness is decided from the inputs and the stored hash, so the embeddings themselves stay deferred
+        queryset = self.with_heavy_fields('content')
+        if issubclass(self.model, Link):
+            queryset = queryset.select_related('link_type')
+        objects = list(queryset)
+        if issubclass(self.model, Link):
+            prefetch_link_endpoints(objects)
+        stale = [obj for obj in objects if obj.embedding_is_stale()]
+        EmbeddingJob.enqueue(stale)
+        return len(stale)
+
+
+class EmbeddableManager(models.Manager.from_queryset(VectorSearchQuerySet)):
+    """
+    Default manager of embedded models. It defers the model's heavy_fields, so that pages listing titles don't
+    fetch a vector and a whole document per row; code that reads them asks for them with with_heavy_fields().
+    """
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.model.heavy_fields)
+
+
+def hash_embedding_inputs(*inputs: Optional[str]) -> str:
+    """
+    Hash of the texts an embedding is computed from, and of the model version that computes it. The texts are hashed
+    exactly as they are: stored passages are character offsets into the content, which any edit can move, even one
+    that only changes whitespace.
+    """
+    return hashlib.sha256('\x00'.join([settings.EMBEDDING_MODEL_VERSION] + [value or '' for value in inputs]).encode('utf-8')).hexdigest()
+
+
 class EmbeddableModel(models.Model):
     embedding = VectorField(dimensions=384, null=True)
+    # hash_embedding_inputs() of the inputs the current embedding was computed from
+    embedding_hash = models.CharField(max_length=64, blank=True, default='')
+    # settings.EMBEDDING_MODEL_VERSION of the model that computed it
+    embedding_version = models.CharField(max_length=255, blank=True, default='')
+
+    # Fields the default manager leaves out
+    heavy_fields = ['embedding']
+
+    objects = EmbeddableManager()
 
     class Meta:
         abstract = True
 
+    def get_embedding_document(self) -> tuple[str, Optional[str]]:
+        """
+        The (text, title) document the embedding is computed from.
+        """
+        return self.content, self.title # type: ignore
+
+    def get_embedding_inputs_hash(self) -> str:
+        return hash_embedding_inputs(*self.get_embedding_document())
+
+    def embedding_is_stale(self) -> bool:
+        # Objects without an embedding have no hash either, so a deferred embedding needn't be loaded to check
+        if 'embedding' in self.get_deferred_fields():
+            return self.embedding_hash != self.get_embedding_inputs_hash()
+        return self.embedding is None or self.embedding_hash != self.get_embedding_inputs_hash()
+
     @classmethod
     def get_similar_objects(cls, embedding, user: User, 
                             exclude_filter: Optional[Q] = None,
                             limit: Optional[int] = None,
                             distance_threshold: float = 0.6,
-                            privacy_level: str = 'own') -> models.QuerySet:
+                            privacy_level: str = 'own',
+                            ef_search: Optional[int] = None,
+                            probes: Optional[int] = None,
+                            candidates: Optional[int] = None) -> models.QuerySet:
+        """
+        Objects within distance_threshold of `embedding`, nearest first. See _search_similar_objects for `candidates`.
+        """
+        queryset = (cls._search_similar_objects(embedding, user, exclude_filter, limit, privacy_level, ef_search, probes, candidates)
+                    .alias(distance=cosine_distance(embedding))
+                    .filter(distance__lt=distance_threshold)
+                    .order_by('distance'))
+        return queryset[:limit] if limit else queryset
 
-        queryset = (cls.objects
-                    .alias(distance=CosineDistance('embedding', embedding))
+    @classmethod
+    def get_similar_object_distances(cls, embedding, user: User,
+                                     exclude_filter: Optional[Q] = None,
+                                     limit: Optional[int] = None,
+                                     distance_threshold: float = 0.6,
+                                     privacy_level: str = 'own',
+                                     ef_search: Optional[int] = None,
+                                     probes: Optional[int] = None,
+                                     candidates: Optional[int] = None) -> models.QuerySet:
+        """
+        Same search as get_similar_objects, but returning (content_type_id, pk, distance) rows,
+        so that the searches of several models can be combined into a single query with union().
+        """
+        content_type = ContentType.objects.get_for_model(cls)
+        queryset = (cls._search_similar_objects(embedding, user, exclude_filter, limit, privacy_level, ef_search, probes, candidates)
+                    .annotate(distance=cosine_distance(embedding))
                     .filter(distance__lt=distance_threshold)
+                    .annotate(content_type_id=models.Value(content_type.pk, output_field=models.IntegerField()))
+                    .values_list('content_type_id', 'pk', 'distance')
                     .order_by('distance'))
-    
+        return queryset[:limit] if limit else queryset
+
+    @classmethod
+    def _search_similar_objects(cls, embedding, user: User,
+                                exclude_filter: Optional[Q],
+                                limit: Optional[int],
+                                privacy_level: str,
+                                ef_search: Optional[int],
+                                probes: Optional[int],
+                                candidates: Optional[int]) -> models.QuerySet:
+        """
+        The objects a similarity search ranks by cosine distance. With `candidates` (settings.EMBEDDING_SEARCH_CANDIDATES
+        by default) and a limit, those are only the `candidates` visible objects nearest to `embedding` by Hamming distance,
+        which the binary index finds at a fraction of the cost; otherwise they are all visible objects.
+        """
+        if candidates is None:
+            candidates = settings.EMBEDDING_SEARCH_CANDIDATES
+        if not candidates or not limit:
+            queryset = cls._scope_similar_objects(cls.objects.all(), user, exclude_filter, None, privacy_level)
+            return queryset.with_filtered_search_settings(limit or 0, ef_search).with_search_settings(probes=probes)
+        candidates = max(candidates, limit)
+        coarse = cls._scope_similar_objects(cls.objects.order_by(hamming_distance(embedding)), user, exclude_filter, candidates, privacy_level)
+        # An HNSW scan returns at most hnsw.ef_search rows, so it has to be allowed to find all of the candidates
+        return cls.objects.filter(pk__in=coarse.values('pk')).with_filtered_search_settings(candidates, ef_search).with_search_settings(probes=probes)
+
+    @classmethod
+    def _scope_similar_objects(cls, queryset: models.QuerySet, user: User,
+                               exclude_filter: Optional[Q],
+                               limit: Optional[int],
+                               privacy_level: str) -> models.QuerySet:
         if issubclass(cls, PrivacySettingsModel):
             privacy_filter = cls.get_privacy_filter(user, privacy_level)
         else:
@@ -235,16 +620,16 @@ class TaggableModel(UserOwnedModel):
 
     def create_tags(self, tags: list[str]):
         with transaction.atomic():
-            tag_objects = [
-                Tag.objects.get_or_create(name=tag_name.lower(), user=self.user)[0] 
-                for tag_name in tags
-            ]            
+            tag_objects = Tag.get_or_create_many(self.user, tags)
             self.tags.add(*tag_objects)
 
     class Meta:
         abstract = True
     
     def tags_for_user(self, user: User) -> list['Tag']:
+        if getattr(self, '_user_tags_of', None) == user.pk:
+            # Loaded by prefetch_for_display()
+            return self._user_tags # type: ignore
         return list(self.tags.filter(user=user))
 
 
@@ -263,25 +648,24 @@ class NodeModel(EmbeddableModel, TaggableModel, PrivacySettingsModel, TimeStampe
             models.Q(source_content_type=content_type, source_object_id=self.pk) |
             models.Q(target_content_type=content_type, target_object_id=self.pk)
         ).select_related('link_type')
-        print(links.all())
         return links.filter(privacy_filter)
 
     def all_linked_objects(self, user: Optional[User] = None) -> list['NodeModel']:
         objects = []
-        for link in self.all_links(user=user):
-            if link.target_content_object == self:
-                objects.append(link.source_content_object)
-            else:
-                objects.append(link.target_content_object)
+        for link in prefetch_link_endpoints(self.all_links(user=user)):
+            other = link.target_content_object if link.is_outgoing_from(self) else link.source_content_object
+            if other is not None:
+                objects.append(other)
         return objects
 
     def get_link_groups(self, user: Optional[User] = None) -> dict[tuple[LinkType, str], list['NodeModel']]:
         link_groups = defaultdict(list)
-        for link in self.all_links(user):
-            direction = "outgoing" if link.source_content_object == self else "incoming"
+        for link in prefetch_link_endpoints(self.all_links(user)):
+            direction = "outgoing" if link.is_outgoing_from(self) else "incoming"
             key = (link.link_type, direction)
             target = link.target_content_object if direction == "outgoing" else link.source_content_object
-            link_groups[key].append(target)
+            if target is not None:
+                link_groups[key].append(target)
         return dict(link_groups)
 
     def related_nodes_filter(self, other_model_class: type['NodeModel']) -> Q:
@@ -316,10 +700,32 @@ class Link(NodeModel, PrivacySettingsModel):
 
     link_type = models.ForeignKey(LinkType, on_delete=models.CASCADE)
 
+    # Copies of the endpoints' titles, so links can be filtered by them without going through the generic foreign keys.
+    # Kept up to date by save() and update_endpoint_titles().
+    source_title = models.CharField(max_length=255, blank=True, default='')
+    target_title = models.CharField(max_length=255, blank=True, default='')
 
     class Meta:
         unique_together = ['source_content_type', 'source_object_id', 'target_content_type', 'target_object_id', 'link_type']
         ordering = ['link_type']
+        indexes = embedding_indexes('link_embedding') + [recency_index('link')]
+
+    def save(self, *args, **kwargs):
+        self.source_title = getattr(self.source_content_object, 'title', '')
+        self.target_title = getattr(self.target_content_object, 'title', '')
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def update_endpoint_titles(cls, node: 'NodeModel'):
+        """
+        Copy the title of `node` to the links from and to it.
+        """
+        content_type = ContentType.objects.get_for_model(node)
+        title = node.title # type: ignore
+        (cls.objects.filter(source_content_type=content_type, source_object_id=node.pk)
+         .exclude(source_title=title).update(source_title=title))
+        (cls.objects.filter(target_content_type=content_type, target_object_id=node.pk)
+         .exclude(target_title=title).update(target_title=title))
 
     def related_nodes_filter(self, other_model_class: type[NodeModel]) -> Q:
         exclude_conditions = super().related_nodes_filter(other_model_class)
@@ -333,9 +739,21 @@ class Link(NodeModel, PrivacySettingsModel):
     def get_list_url(cls):
         return reverse('links')
 
+    def is_outgoing_from(self, node: NodeModel) -> bool:
+        content_type = ContentType.objects.get_for_model(node)
+        return self.source_content_type_id == content_type.pk and self.source_object_id == node.pk # type: ignore
+
     def get_absolute_url(self):
         return reverse('link_view', args=[self.pk])
 
+    def get_embedding_document(self) -> tuple[str, Optional[str]]:
+        return self.link_type.name, self.link_type.reverse_name
+
+    def get_embedding_inputs_hash(self) -> str:
+        # A link's embedding is mixed with its endpoints' embeddings, so it is stale when theirs change
+        ends = [self.source_content_object, self.target_content_object]
+        return hash_embedding_inputs(*self.get_embedding_document(), *[end.embedding_hash if end is not None else '' for end in ends]) # type: ignore
+
     def is_viewable_by(self, user: User, privacy_level: str = 'fof') -> bool:
         return self.source_content_object.is_viewable_by(user, privacy_level) and self.target_content_object.is_viewable_by(user, privacy_level) # type: ignore
 
@@ -362,10 +780,95 @@ class Link(NodeModel, PrivacySettingsModel):
 
 
 
+def prefetch_link_endpoints(objects: Iterable, with_embeddings: bool = False) -> list[Link]:
+    """
+    Resolve the source and target objects of many links with one in_bulk query per content type,
+    instead of one query per endpoint. Anything that isn't a Link is skipped, so mixed feed lists can be passed as is.
+    The endpoints' embeddings are only loaded if with_embeddings is set.
+    """
+    links = [o for o in objects if isinstance(o, Link)]
+    pks_by_content_type = defaultdict(set)
+    for link in links:
+        pks_by_content_type[link.source_content_type_id].add(link.source_object_id) # type: ignore
+        pks_by_content_type[link.target_content_type_id].add(link.target_object_id) # type: ignore
+    objects_by_content_type = {
+        content_type_id: _endpoint_queryset(ContentType.objects.get_for_id(content_type_id).model_class(), with_embeddings).in_bulk(pks) # type: ignore
+        for content_type_id, pks in pks_by_content_type.items()
+    }
+    source_field = Link._meta.get_field('source_content_object')
+    target_field = Link._meta.get_field('target_content_object')
+    for link in links:
+        source_field.set_cached_value(link, objects_by_content_type[link.source_content_type_id].get(link.source_object_id)) # type: ignore
+        target_field.set_cached_value(link, objects_by_content_type[link.target_content_type_id].get(link.target_object_id)) # type: ignore
+    return links
+
+
+def prefetch_linked_objects(nodes: list['NodeModel'], user: User):
+    """
+    Set `linked_objects` of many nodes to what their all_linked_objects(user) returns, with one query for the links of all
+    of them and one per content type of the objects at their other ends.
+    """
+    nodes_by_key = dict()
+    pks_by_content_type = defaultdict(list)
+    for node in nodes:
+        content_type_id = ContentType.objects.get_for_model(node).pk
+        nodes_by_key[(content_type_id, node.pk)] = node
+        pks_by_content_type[content_type_id].append(node.pk)
+        node.linked_objects = [] # type: ignore
+    if not nodes_by_key:
+        return
+    ends = Q()
+    for content_type_id, pks in pks_by_content_type.items():
+        ends |= Q(source_content_type=content_type_id, source_object_id__in=pks)
+        ends |= Q(target_content_type=content_type_id, target_object_id__in=pks)
+    links = Link.objects.filter(ends).filter(Link.get_privacy_filter(user, 'fof')).select_related('link_type')
+    for link in prefetch_link_endpoints(links):
+        source = nodes_by_key.get((link.source_content_type_id, link.source_object_id)) # type: ignore
+        target = nodes_by_key.get((link.target_content_type_id, link.target_object_id)) # type: ignore
+        if source is not None and link.target_content_object is not None:
+            source.linked_objects.append(link.target_content_object)
+        if target is not None and target is not source and link.source_content_object is not None:
+            target.linked_objects.append(link.source_content_object)
+
+
+def prefetch_for_display(objects: Iterable, user: User, with_linked_objects: bool = False) -> list:
+    """
+    Load what feed cards and table rows show of many objects, in a fixed number of queries however many objects there
+    are: their owners, the tags `user` gave them (which tags_for_user(user) then returns without a query), and the link
+    types and endpoints of links. With `with_linked_objects`, nodes also get their `linked_objects` (see
+    prefetch_linked_objects). Objects of different classes can be mixed.
+    """
+    objects = list(objects)
+    objects_by_class = defaultdict(list)
+    for obj in objects:
+        objects_by_class[type(obj)].append(obj)
+    for model_class, instances in objects_by_class.items():
+        lookups = ['user']
+        if issubclass(model_class, TaggableModel):
+            lookups.append(Prefetch('tags', queryset=Tag.objects.filter(user=user), to_attr='_user_tags'))
+        if model_class is Link:
+            lookups.append('link_type')
+        prefetch_related_objects(instances, *lookups)
+        if issubclass(model_class, TaggableModel):
+            for instance in instances:
+                instance._user_tags_of = user.pk
+    prefetch_link_endpoints(objects)
+    if with_linked_objects:
+        prefetch_linked_objects([obj for obj in objects if isinstance(obj, NodeModel)], user)
+    return objects
+
+
+def _endpoint_queryset(model_class, with_embeddings: bool) -> models.QuerySet:
+    queryset = model_class.objects.all()
+    return queryset.with_heavy_fields('embedding') if with_embeddings else queryset
+
 
 class Memo(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySettingsModel):
+    heavy_fields = ['embedding', 'content']
+
     class Meta:
         ordering = ['-created_at']
+        indexes = embedding_indexes('memo_embedding') + [search_document_index('memo')] + list_indexes('memo') + [recency_index('memo')]
 
     @classmethod
     def get_list_url(cls):
@@ -380,9 +883,12 @@ class Reference(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySetti
     source_name = models.CharField(max_length=255, blank=True, null=True)
     publication_date = models.DateField(blank=True, null=True)
     authors = models.CharField(max_length=255, blank=True, null=True)
+
+    heavy_fields = ['embedding', 'content']
     
     class Meta:
         ordering = ['-created_at']
+        indexes = embedding_indexes('reference_embedding') + [search_document_index('reference')] + list_indexes('reference') + [recency_index('reference')]
 
     def get_absolute_url(self):
         return reverse('reference_view', args=[str(self.pk)])
@@ -393,8 +899,12 @@ class Reference(TitleAndContentModel, NodeModel, SummarizableModel, PrivacySetti
 
 
 class Inkling(TitleAndContentModel, NodeModel, PrivacySettingsModel):
+    # An inkling is a single short idea, and lists show it in full, so its content is always loaded
+    heavy_fields = ['embedding']
+
     class Meta:
         ordering = ['-created_at']
+        indexes = embedding_indexes('inkling_embedding') + [search_document_index('inkling')] + list_indexes('inkling') + [recency_index('inkling')]
     
     def get_absolute_url(self):
         return reverse('inkling_view', args=[str(self.pk)])
@@ -414,6 +924,7 @@ class Tag(EmbeddableModel, UserOwnedModel, TimeStampedModel):
     class Meta:
         unique_together = ['user', 'name']
         ordering = ['name']
+        indexes = embedding_indexes('tag_embedding')
 
     def __str__(self):
         return self.name
@@ -422,14 +933,214 @@ class Tag(EmbeddableModel, UserOwnedModel, TimeStampedModel):
     def title(self):
         return self.name
 
+    def get_embedding_document(self) -> tuple[str, Optional[str]]:
+        return self.name, None
+
     def get_absolute_url(self):
         return reverse('tag_view', args=[str(self.pk)])
+
+    @classmethod
+    def get_or_create_many(cls, user: User, names: list[str]) -> list['Tag']:
+        """
+        Get or create several tags at once. New tags are queued for embedding together,
+        so the worker encodes them in one batch. bulk_create() sends no post_save, so the caches that the tag
+        receivers would invalidate are invalidated here. Tags that another request creates meanwhile are
+        skipped rather than failing the insert, and the tags are then read back by name.
+        """
+        # Imported here because app.sidebar imports the models
+        from .sidebar import invalidate_sidebar
+
+        names = list(dict.fromkeys(name.lower().strip() for name in names if name.strip()))
+        existing = set(cls.objects.filter(user=user, name__in=names).values_list('name', flat=True))
+        cls.objects.bulk_create([cls(user=user, name=name) for name in names if name not in existing], ignore_conflicts=True)
+        tags = {tag.name: tag for tag in cls.objects.filter(user=user, name__in=names)}
+        created = [tag for name, tag in tags.items() if name not in existing]
+        EmbeddingJob.enqueue(created)
+        if created:
+            invalidate_sidebar(user.pk)
+            bump_corpus_versions([user.pk])
+        return [tags[name] for name in names]
     
     @classmethod
     def get_list_url(cls):
         return reverse('tags')
 
 
+class NodeChunk(models.Model):
+    """
+    Embedding of one passage of a node's content, content[start:end], for passage-level search.
+    The title is stored as a chunk too, with no span. Search only reads the chunks of the current model version,
+    so manage.py reembed can store the next version's chunks alongside.
+    """
+    version = models.CharField(max_length=255)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    position = models.PositiveIntegerField()
+    start = models.PositiveIntegerField(null=True)
+    end = models.PositiveIntegerField(null=True)
+    embedding = VectorField(dimensions=384)
+
+    objects = VectorSearchQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ['version', 'content_type', 'object_id', 'position']
+        indexes = embedding_indexes('nodechunk_embedding')
+
+    @classmethod
+    def replace_for(cls, obj: models.Model, passages: Iterable, version: Optional[str] = None):
+        """
+        Replace the stored chunks of obj with the given passages (anything with start, end and embedding).
+        A stored chunk with the same embedding as a passage keeps its row, with its span updated if the passage moved,
+        so only the chunks of added and removed passages are inserted into or deleted from the index.
+        Added chunks take the lowest free positions: positions tell an object's chunks apart, they don't order them.
+        """
+        version = version or settings.EMBEDDING_MODEL_VERSION
+        content_type = ContentType.objects.get_for_model(obj)
+        with transaction.atomic():
+            stored = defaultdict(list)
+            for chunk in cls.objects.filter(version=version, content_type=content_type, object_id=obj.pk).order_by('position'):
+                stored[np.asarray(chunk.embedding, dtype=np.float32).tobytes()].append(chunk)
+            kept_positions = set()
+            moved = []
+            added = []
+            for passage in passages:
+                matches = stored.get(np.asarray(passage.embedding, dtype=np.float32).tobytes())
+                if not matches:
+                    added.append(passage)
+                    continue
+                chunk = matches.pop(0)
+                kept_positions.add(chunk.position)
+                if (chunk.start, chunk.end) != (passage.start, passage.end):
+                    chunk.start, chunk.end = passage.start, passage.end
+                    moved.append(chunk)
+            cls.objects.filter(pk__in=[chunk.pk for chunks in stored.values() for chunk in chunks]).delete()
+            cls.objects.bulk_update(moved, ['start', 'end'])
+            free_positions = (position for position in itertools.count() if position not in kept_positions)
+            cls.objects.bulk_create([
+                cls(version=version, content_type=content_type, object_id=obj.pk, position=position,
+                    start=passage.start, end=passage.end, embedding=passage.embedding)
+                for position, passage in zip(free_positions, added)
+            ])
+
+
+class StagedEmbedding(models.Model):
+    """
+    Embedding computed by manage.py reembed for a model version that isn't live yet.
+    Search keeps reading the live embeddings until `manage.py reembed --activate` copies these over them.
+    """
+    version = models.CharField(max_length=255)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    embedding = VectorField(dimensions=384)
+    embedding_hash = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        unique_together = ['version', 'content_type', 'object_id']
+
+
+class QueuedJob(TimeStampedModel):
+    """
+    An object waiting to be processed by a worker (see app.job_queue).
+    A job becomes available again at `available_at` if the worker that claimed it never finished.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        abstract = True
+        unique_together = ['content_type', 'object_id']
+
+    @classmethod
+    def enqueue(cls, objects: Iterable[models.Model]):
+        """
+        Queue objects for the worker. Re-queueing an object that is already queued,
+        or currently being processed, makes it available again so that its latest state gets processed.
+        """
+        now = timezone.now()
+        jobs = [
+            cls(content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk, available_at=now)
+            for obj in objects
+        ]
+        cls.objects.bulk_create(jobs, update_conflicts=True, unique_fields=['content_type', 'object_id'], update_fields=['available_at'])
+
+
+class EmbeddingJob(QueuedJob):
+    """
+    An object whose embedding is waiting to be computed by the embedding worker.
+    """
+    class Meta(QueuedJob.Meta):
+        indexes = [models.Index(fields=['available_at'], name='embeddingjob_available_idx')]
+
+
+class TimelineJob(QueuedJob):
+    """
+    A node or link whose TimelineEntry rows are waiting to be fanned out to its audience, or a user whose
+    timeline is waiting to be rebuilt after their friendships changed. See app.timeline.
+    """
+    class Meta(QueuedJob.Meta):
+        indexes = [models.Index(fields=['available_at'], name='timelinejob_available_idx')]
+
+
+class TimelineEntry(models.Model):
+    """
+    An object in the home feed of `viewer`, written when the object or the viewer's friendships change (fan-out on
+    write) so that reading a feed tab is a range scan of the viewer's entries. `privacy_level` is the social distance
+    from the viewer to the object's owner (OWN, UserReach.FRIEND or UserReach.FRIEND_OF_FRIEND): a tab shows the
+    entries up to its distance. `ts` is when the object was last updated.
+    """
+    OWN = 0
+
+    viewer = models.ForeignKey(User, related_name='timeline', on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    privacy_level = models.PositiveSmallIntegerField()
+    ts = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['viewer', 'content_type', 'object_id']
+        indexes = [
+            models.Index(fields=['viewer', 'content_type', '-ts'], name='timelineentry_viewer_ts_idx'),
+            models.Index(fields=['content_type', 'object_id'], name='timelineentry_object_idx'),
+        ]
+
+
+class CachedEmbedding(models.Model):
+    """
+    Embedding of a (text, title) document, keyed by the model version that produced it (in model_name)
+    and a hash of the normalized document.
+    """
+    model_name = models.CharField(max_length=255)
+    key = models.CharField(max_length=64)
+    embedding = VectorField(dimensions=384)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['model_name', 'key']
+
+
+class QueryEmbedding(models.Model):
+    """
+    Embedding of a normalized search query, shared by every worker until it is settings.QUERY_EMBEDDING_TTL old.
+    `hits` and `last_used_at` record how popular the query is.
+    """
+    model_name = models.CharField(max_length=255)
+    # Hash of the normalized query
+    key = models.CharField(max_length=64)
+    query = models.TextField()
+    embedding = VectorField(dimensions=384)
+    encoded_at = models.DateTimeField()
+    hits = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['model_name', 'key']
+
+
 @dataclass
 class Query:
     query: str
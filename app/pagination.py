@@ -0,0 +1,88 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models import Q
+
+
+@dataclass
+class KeysetPage:
+    objects: list
+    # Points after the last of `objects`; None on the last page
+    next_cursor: Optional[str]
+
+
+def keyset_page(queryset: models.QuerySet, ordering: list[str], cursor: Optional[str], per_page: int) -> KeysetPage:
+    """
+    One page of `queryset` ordered by `ordering` (names of fields or annotations, '-' for descending, the last of them
+    unique), starting after the row `cursor` points at, or at the start without a (valid) cursor. Instead of skipping the
+    rows of earlier pages with OFFSET, the page starts by comparing with the last row of the previous page, which an index
+    over `ordering` finds directly, so deep pages cost as little as the first.
+    """
+    values = _decode_cursor(queryset, ordering, cursor) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+    objects = list(queryset.order_by(*ordering)[:per_page + 1])
+    if len(objects) <= per_page:
+        return KeysetPage(objects, None)
+    objects = objects[:per_page]
+    return KeysetPage(objects, _encode_cursor(ordering, [getattr(objects[-1], name.lstrip('-')) for name in ordering]))
+
+
+def estimate_count(queryset: models.QuerySet, exact_below: int) -> tuple[int, bool]:
+    """
+    How many rows `queryset` has, and whether that is exact. When the planner expects fewer than `exact_below` rows they
+    are counted; otherwise the planner's estimate is returned, so long lists aren't scanned just to be counted.
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < exact_below:
+        return queryset.count(), True
+    return estimate, False
+
+
+def _after(ordering: list[str], values: list[Any]) -> Q:
+    """
+    Rows that come after `values` in `ordering`: bigger in the first field, or equal in it and bigger in the next, and so on.
+    """
+    after = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        after |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    return after
+
+
+def _encode_cursor(ordering: list[str], values: list[Any]) -> str:
+    # str() rather than DjangoJSONEncoder, which would cut datetimes to milliseconds
+    return signing.dumps(json.dumps(dict(ordering=ordering, values=values), default=str), salt='keyset')
+
+
+def _decode_cursor(queryset: models.QuerySet, ordering: list[str], cursor: str) -> Optional[list[Any]]:
+    """
+    The values a cursor of the same ordering points after, or None if it belongs to another ordering or isn't valid.
+    """
+    try:
+        decoded = json.loads(signing.loads(cursor, salt='keyset'))
+        if decoded['ordering'] != ordering:
+            return None
+        return [_get_field(queryset, name.lstrip('-')).to_python(value) for name, value in zip(ordering, decoded['values'], strict=True)]
+    except (signing.BadSignature, ValidationError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _get_field(queryset: models.QuerySet, name: str) -> models.Field:
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name) # type: ignore
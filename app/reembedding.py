@@ -0,0 +1,212 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+import django
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, models, transaction
+from django.db.models import OuterRef, Q, Subquery, Value
+
+from .embedding_queue import (combine_embedding, get_document,
+                              get_embedding_field, get_version_field)
+from .embeddings import generate_embeddings, generate_passage_embeddings
+from .models import (CachedEmbedding, EmbeddableModel, Inkling, Link, Memo,
+                     NodeChunk, QueryEmbedding, Reference, StagedEmbedding,
+                     Tag, TitleAndContentModel, User, prefetch_link_endpoints)
+
+# Links are built from their endpoints' embeddings, so they come last
+REEMBEDDED_MODELS: list[type[models.Model]] = [Memo, Reference, Inkling, Tag, User, Link]
+
+
+@dataclass
+class Reembedded:
+    pk: int
+    embedding: np.ndarray
+    embedding_hash: str = ''
+    passages: Optional[list] = field(default=None, repr=False)
+
+
+def keyset_batches(queryset: models.QuerySet, batch_size: int) -> Iterator[list[int]]:
+    """
+    Primary keys of the queryset in ascending batches, each fetched with `pk > last pk` rather than an offset.
+    """
+    after = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        after = pks[-1]
+
+
+def pending_objects(model_class: type[models.Model]) -> models.QuerySet:
+    """
+    Objects that have neither a live nor a staged embedding from the current model version.
+    The staged embeddings are the backfill's checkpoint: an interrupted backfill carries on where it stopped.
+    """
+    version = settings.EMBEDDING_MODEL_VERSION
+    staged = StagedEmbedding.objects.filter(version=version, content_type=ContentType.objects.get_for_model(model_class)).values('object_id')
+    queryset = model_class.objects.exclude(pk__in=staged).exclude(**{get_version_field(model_class()): version})
+    if model_class is User:
+        queryset = queryset.filter(intention_embedding__isnull=False)
+    return queryset
+
+
+def embed_batch(model_label: str, pks: list[int]) -> list[Reembedded]:
+    """
+    Compute the current version's embeddings of some objects of one model. Runs in the backfill's worker processes.
+    """
+    model_class = apps.get_model(model_label)
+    queryset = model_class.objects.filter(pk__in=pks)
+    if issubclass(model_class, EmbeddableModel):
+        queryset = queryset.with_heavy_fields()
+    if model_class is Link:
+        queryset = queryset.select_related('link_type')
+    objects = list(queryset)
+    if model_class is Link:
+        prefetch_link_endpoints(objects, with_embeddings=True)
+        objects = _use_staged_endpoints(objects)
+
+    results = []
+    if issubclass(model_class, TitleAndContentModel):
+        for obj, (embedding, passages) in zip(objects, generate_passage_embeddings([get_document(obj) for obj in objects])):
+            results.append(Reembedded(obj.pk, embedding, passages=passages))
+    else:
+        for obj, embedding in zip(objects, generate_embeddings([get_document(obj) for obj in objects])):
+            results.append(Reembedded(obj.pk, combine_embedding(obj, embedding)))
+    for obj, result in zip(objects, results):
+        if isinstance(obj, EmbeddableModel):
+            result.embedding_hash = obj.get_embedding_inputs_hash()
+    return results
+
+
+def _use_staged_endpoints(links: list[Link]) -> list[Link]:
+    """
+    Swap the links' endpoint embeddings for the current version's, leaving out links with an endpoint that has none yet.
+    """
+    version = settings.EMBEDDING_MODEL_VERSION
+    links = [link for link in links if link.source_content_object is not None and link.target_content_object is not None]
+    if not links:
+        return []
+    endpoint_filter = Q()
+    for link in links:
+        for end in [link.source_content_object, link.target_content_object]:
+            endpoint_filter |= Q(content_type=ContentType.objects.get_for_model(end), object_id=end.pk)
+    staged = {
+        (content_type_id, object_id): (embedding, embedding_hash)
+        for content_type_id, object_id, embedding, embedding_hash
+        in StagedEmbedding.objects.filter(endpoint_filter, version=version).values_list('content_type_id', 'object_id', 'embedding', 'embedding_hash')
+    }
+
+    ready = []
+    for link in links:
+        ends = [link.source_content_object, link.target_content_object]
+        keys = [(ContentType.objects.get_for_model(end).pk, end.pk) for end in ends]
+        if not all(key in staged or end.embedding_version == version for key, end in zip(keys, ends)): # type: ignore
+            continue
+        for key, end in zip(keys, ends):
+            if key in staged:
+                end.embedding, end.embedding_hash = staged[key] # type: ignore
+        ready.append(link)
+    return ready
+
+
+def save_batch(model_class: type[models.Model], results: list[Reembedded]):
+    version = settings.EMBEDDING_MODEL_VERSION
+    content_type = ContentType.objects.get_for_model(model_class)
+    with transaction.atomic():
+        StagedEmbedding.objects.bulk_create([
+            StagedEmbedding(version=version, content_type=content_type, object_id=result.pk,
+                            embedding=result.embedding, embedding_hash=result.embedding_hash)
+            for result in results
+        ], ignore_conflicts=True)
+        for result in results:
+            if result.passages is not None:
+                NodeChunk.replace_for(model_class(pk=result.pk), result.passages, version)
+
+
+def backfill(batch_size: int, workers: int = 1, log: Callable[[str], None] = print):
+    """
+    Stage the current version's embedding of every object that doesn't have one yet, fanning batches out
+    over `workers` processes. Search keeps using the live embeddings meanwhile.
+    """
+    pool = None
+    if workers > 1:
+        # The workers open their own connections; they mustn't share the ones this process has open
+        connections.close_all()
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    try:
+        for model_class in REEMBEDDED_MODELS:
+            label = model_class._meta.label
+            done = 0
+            batches = keyset_batches(pending_objects(model_class), batch_size)
+            if pool is None:
+                for pks in batches:
+                    results = embed_batch(label, pks)
+                    save_batch(model_class, results)
+                    done += len(results)
+                    log(f"{label}: {done}")
+                continue
+            running = set()
+            for pks in batches:
+                running.add(pool.submit(embed_batch, label, pks))
+                # Keep every worker busy without queueing up the whole table
+                if len(running) >= 2 * workers:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    done += _save_finished(model_class, finished)
+                    log(f"{label}: {done}")
+            done += _save_finished(model_class, running)
+            log(f"{label}: {done}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _save_finished(model_class: type[models.Model], futures) -> int:
+    saved = 0
+    for future in futures:
+        results = future.result()
+        save_batch(model_class, results)
+        saved += len(results)
+    return saved
+
+
+def count_pending() -> dict[str, int]:
+    return {model_class._meta.label: pending_objects(model_class).count() for model_class in REEMBEDDED_MODELS}
+
+
+def activate(batch_size: int) -> int:
+    """
+    Replace the live embeddings with the staged ones in one transaction, and drop other versions' chunks and cached embeddings.
+    Objects edited after they were staged are then queued for the embedding worker. Returns how many were queued.
+    """
+    version = settings.EMBEDDING_MODEL_VERSION
+    with transaction.atomic():
+        for model_class in REEMBEDDED_MODELS:
+            staged = StagedEmbedding.objects.filter(version=version, content_type=ContentType.objects.get_for_model(model_class))
+            row = staged.filter(object_id=OuterRef('pk'))
+            embedding_field = get_embedding_field(model_class())
+            updates = {
+                embedding_field: Subquery(row.values('embedding')[:1]),
+                get_version_field(model_class()): Value(version),
+            }
+            if issubclass(model_class, EmbeddableModel):
+                updates['embedding_hash'] = Subquery(row.values('embedding_hash')[:1])
+            model_class.objects.filter(pk__in=staged.values('object_id')).update(**updates)
+        NodeChunk.objects.exclude(version=version).delete()
+        CachedEmbedding.objects.exclude(model_name=version).delete()
+        QueryEmbedding.objects.exclude(model_name=version).delete()
+        StagedEmbedding.objects.filter(version=version).delete()
+        # Every search result may have changed
+        User.objects.update(corpus_version=models.F('corpus_version') + 1)
+
+    queued = 0
+    for model_class in REEMBEDDED_MODELS:
+        if issubclass(model_class, EmbeddableModel):
+            for pks in keyset_batches(model_class.objects.all(), batch_size):
+                queued += model_class.objects.filter(pk__in=pks).enqueue_stale_embeddings() # type: ignore
+    return queued
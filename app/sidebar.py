@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .models import Memo, Reference, Tag, User
+
+# Section name: (model, field shown as the label, detail view)
+SECTIONS = {
+    'memos': (Memo, 'title', 'memo_view'),
+    'references': (Reference, 'title', 'reference_view'),
+    'tags': (Tag, 'name', 'tag_view'),
+}
+LABEL_FIELDS = {model: label_field for model, label_field, _url_name in SECTIONS.values()}
+
+
+def invalidate_sidebar(user_id: int):
+    """
+    Make every cached sidebar page of the user stale, by moving their cache keys to a new version.
+    """
+    User.objects.filter(pk=user_id).update(sidebar_version=F('sidebar_version') + 1)
+
+
+def render_sidebar_page(user: User, section: str, page_number: int) -> str:
+    """
+    HTML list items for one page of a sidebar section, followed by a link to the next page if there is one.
+    Rendered pages are cached per user until invalidate_sidebar() is called for them.
+    """
+    key = f'sidebar:{user.pk}:{user.sidebar_version}:{section}:{page_number}'
+    html = cache.get(key)
+    if html is None:
+        model, label_field, url_name = SECTIONS[section]
+        paginator = Paginator(model.objects.filter(user=user).only('pk', label_field), settings.SIDEBAR_PAGE_SIZE)
+        page = paginator.get_page(page_number)
+        items = [(reverse(url_name, args=[obj.pk]), getattr(obj, label_field)) for obj in page]
+        html = render_to_string('layouts/_sidebar_page.html', dict(section=section, page=page, items=items))
+        cache.set(key, html, settings.SIDEBAR_CACHE_TIMEOUT)
+    return html
@@ -1,36 +1,99 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
 from django.dispatch import receiver
 
-from .embeddings import generate_embedding
-from .models import Inkling, Link, Memo, Reference, Tag
+from .embedding_queue import enqueue_embedding
+from .models import (Inkling, Link, Memo, Reference, Tag, User, UserReach,
+                     bump_corpus_versions)
+from .sidebar import LABEL_FIELDS, invalidate_sidebar
+from .timeline import enqueue_timeline
 
 
 @receiver(post_save, sender=Inkling)
-def generate_and_save_embedding_for_inkling(sender, instance, **kwargs):
-    if instance.embedding is None:
-        instance.embedding = generate_embedding(instance.content, instance.title)
-        instance.save(update_fields=['embedding'])
+def enqueue_embedding_for_inkling(sender, instance, **kwargs):
+    if instance.embedding_is_stale():
+        enqueue_embedding(instance)
 
 @receiver(post_save, sender=Link)
-def generate_and_save_embedding_for_link(sender, instance, **kwargs):
-    if instance.embedding is None:
-        instance.embedding = (0.2 * generate_embedding(instance.link_type.name, instance.link_type.reverse_name)) + (0.4* instance.source_content_object.embedding) + (0.4 * instance.target_content_object.embedding)
-        instance.save(update_fields=['embedding'])
+def enqueue_embedding_for_link(sender, instance, **kwargs):
+    if instance.embedding_is_stale():
+        enqueue_embedding(instance)
 
 @receiver(post_save, sender=Memo)
-def generate_and_save_embedding_for_memo(sender, instance, **kwargs):
-    if instance.embedding is None:
-        instance.embedding = generate_embedding(instance.content, instance.title)
-        instance.save(update_fields=['embedding'])
+def enqueue_embedding_for_memo(sender, instance, **kwargs):
+    if instance.embedding_is_stale():
+        enqueue_embedding(instance)
 
 @receiver(post_save, sender=Reference)
-def generate_and_save_embedding_for_reference(sender, instance, **kwargs):
-    if instance.embedding is None:
-        instance.embedding = generate_embedding(instance.content, instance.title)
-        instance.save(update_fields=['embedding'])
+def enqueue_embedding_for_reference(sender, instance, **kwargs):
+    if instance.embedding_is_stale():
+        enqueue_embedding(instance)
 
 @receiver(post_save, sender=Tag)
-def generate_and_save_embedding_for_tag(sender, instance, **kwargs):
-    if instance.embedding is None:
-        instance.embedding = generate_embedding(instance.name)
-        instance.save(update_fields=['embedding'])
+def enqueue_embedding_for_tag(sender, instance, **kwargs):
+    if instance.embedding_is_stale():
+        enqueue_embedding(instance)
+
+@receiver(post_save, sender=Inkling)
+@receiver(post_save, sender=Memo)
+@receiver(post_save, sender=Reference)
+def update_titles_of_links(sender, instance, created, **kwargs):
+    if not created:
+        Link.update_endpoint_titles(instance)
+
+@receiver(pre_save, sender=Memo)
+@receiver(pre_save, sender=Reference)
+@receiver(pre_save, sender=Tag)
+def note_sidebar_label_change(sender, instance, update_fields, **kwargs):
+    # The sidebar lists labels in an order fixed at creation, so an edit only changes it if it changes the label
+    label_field = LABEL_FIELDS[sender]
+    instance._sidebar_label_changed = False
+    if instance._state.adding or (update_fields is not None and label_field not in update_fields):
+        return
+    stored_label = sender.objects.filter(pk=instance.pk).values_list(label_field, flat=True).first()
+    instance._sidebar_label_changed = stored_label != getattr(instance, label_field)
+
+@receiver(post_save, sender=Memo)
+@receiver(post_save, sender=Reference)
+@receiver(post_save, sender=Tag)
+def invalidate_sidebar_of_owner(sender, instance, created, **kwargs):
+    if created or instance._sidebar_label_changed:
+        invalidate_sidebar(instance.user_id)
+
+@receiver(post_delete, sender=Memo)
+@receiver(post_delete, sender=Reference)
+@receiver(post_delete, sender=Tag)
+def invalidate_sidebar_of_deleted(sender, instance, **kwargs):
+    invalidate_sidebar(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Inkling)
+@receiver([post_save, post_delete], sender=Link)
+@receiver([post_save, post_delete], sender=Memo)
+@receiver([post_save, post_delete], sender=Reference)
+@receiver([post_save, post_delete], sender=Tag)
+def bump_corpus_version_of_audience(sender, instance, **kwargs):
+    bump_corpus_versions([instance.user_id])
+
+@receiver(m2m_changed, sender=Inkling.tags.through)
+@receiver(m2m_changed, sender=Link.tags.through)
+@receiver(m2m_changed, sender=Memo.tags.through)
+@receiver(m2m_changed, sender=Reference.tags.through)
+def bump_corpus_version_on_tagging(sender, instance, action, **kwargs):
+    # A node's tags are left out of its similar tags, and a tag's nodes out of its feed
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        bump_corpus_versions([instance.user_id])
+
+@receiver([post_save, post_delete], sender=Inkling)
+@receiver([post_save, post_delete], sender=Link)
+@receiver([post_save, post_delete], sender=Memo)
+@receiver([post_save, post_delete], sender=Reference)
+def enqueue_timeline_fan_out(sender, instance, **kwargs):
+    enqueue_timeline(instance)
+
+@receiver(pre_delete, sender=User)
+def refresh_reach_of_friends(sender, instance, **kwargs):
+    # The friends of a deleted user may have reached each other only through them
+    friend_ids = set(instance.friends.values_list('pk', flat=True))
+    if friend_ids:
+        transaction.on_commit(lambda: UserReach.refresh_for(friend_ids))
@@ -0,0 +1,41 @@
+// The home feed's tabs are continued from the home_feed_page view: the next page is fetched when a tab's
+// "More" link scrolls into view, or when it is clicked.
+(function () {
+    function loadPage(item) {
+        if (item.dataset.loading) {
+            return;
+        }
+        item.dataset.loading = 'true';
+        fetch(item.querySelector('a').href, { credentials: 'same-origin' })
+            .then(function (response) { return response.text(); })
+            .then(function (html) {
+                item.insertAdjacentHTML('beforebegin', html);
+                item.remove();
+                observeAll();
+            });
+    }
+
+    var observer = 'IntersectionObserver' in window ? new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                loadPage(entry.target);
+            }
+        });
+    }) : null;
+
+    function observeAll() {
+        if (observer) {
+            document.querySelectorAll('[data-feed-more]').forEach(function (item) { observer.observe(item); });
+        }
+    }
+
+    document.addEventListener('click', function (event) {
+        var item = event.target.closest('[data-feed-more]');
+        if (item) {
+            event.preventDefault();
+            loadPage(item);
+        }
+    });
+    document.addEventListener('DOMContentLoaded', observeAll);
+})();
@@ -0,0 +1,48 @@
+// The sidebar's lists are fetched from the sidebar_page view: a tab's first page when the tab is first shown,
+// and each following page when its "More" link is clicked.
+(function () {
+    function markCurrent(list) {
+        list.querySelectorAll('a.nav-link').forEach(function (link) {
+            if (link.pathname === window.location.pathname) {
+                link.classList.add('active');
+            }
+        });
+    }
+
+    function loadPage(item) {
+        if (item.dataset.loading) {
+            return;
+        }
+        item.dataset.loading = 'true';
+        var list = item.parentElement;
+        fetch(item.querySelector('a').href, { credentials: 'same-origin' })
+            .then(function (response) { return response.text(); })
+            .then(function (html) {
+                item.insertAdjacentHTML('beforebegin', html);
+                item.remove();
+                markCurrent(list);
+            });
+    }
+
+    function loadFirstPage(pane) {
+        var item = pane && pane.querySelector('[data-sidebar-more]');
+        if (item && !pane.dataset.loaded) {
+            pane.dataset.loaded = 'true';
+            loadPage(item);
+        }
+    }
+
+    document.addEventListener('click', function (event) {
+        var item = event.target.closest('#sidebar [data-sidebar-more]');
+        if (item) {
+            event.preventDefault();
+            loadPage(item);
+        }
+    });
+    document.addEventListener('shown.bs.tab', function (event) {
+        loadFirstPage(document.querySelector('#sidebar ' + event.target.getAttribute('href')));
+    });
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('#sidebar .tab-pane.active').forEach(loadFirstPage);
+    });
+})();
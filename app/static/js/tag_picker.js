@@ -0,0 +1,20 @@
+// The add-tag forms' tag pickers are filled from the tag_options view when one of them is first opened.
+// The options are fetched once per page and shared by the pickers of every card.
+(function () {
+    var options = null;
+
+    document.addEventListener('show.bs.modal', function (event) {
+        var select = event.target.querySelector('select[data-options-url]');
+        if (!select || select.dataset.loaded) {
+            return;
+        }
+        select.dataset.loaded = 'true';
+        if (!options) {
+            options = fetch(select.dataset.optionsUrl, { credentials: 'same-origin' })
+                .then(function (response) { return response.text(); });
+        }
+        options.then(function (html) {
+            select.innerHTML = html;
+        });
+    });
+})();
@@ -5,7 +5,7 @@ from django.utils.html import format_html, mark_safe  # type: ignore
 from django_tables2.utils import A
 
 from .models import (FriendRequest, Inkling, Link, LinkType, Memo, NodeModel,
-                     Reference, Tag, User, UserInvite)
+                     Reference, Tag, User, UserInvite, prefetch_for_display)
 
 TEMPLATE_NAME = "django_tables2/bootstrap5.html"
 
@@ -50,14 +50,17 @@ class BaseNodeTable(EditableMixin, tables.Table):
         template_name = TEMPLATE_NAME
         fields = ("title", "privacy_setting", "tags", "links")
 
+    def before_render(self, request):
+        prefetch_for_display((row.record for row in self.paginated_rows), request.user, with_linked_objects=True)
+
     def render_title(self, record):
         return link_to_object_html(record)
 
-    def render_tags(self, value):
-        return mark_safe(", ".join(link_to_object_html(tag) for tag in value.all()))
+    def render_tags(self, record):
+        return mark_safe(", ".join(link_to_object_html(tag) for tag in record.tags_for_user(self.request.user)))
 
     def render_links(self, record):
-        return mark_safe(", ".join(link_to_object_html(other) for other in record.all_linked_objects()))
+        return mark_safe(", ".join(link_to_object_html(other) for other in record.linked_objects))
 
 
 class ReferenceTable(BaseNodeTable):
@@ -87,6 +90,9 @@ class LinkTable(EditableMixin, tables.Table):
         template_name = TEMPLATE_NAME
         fields = ("source", "link_type", "target", "created_at", "updated_at")
 
+    def before_render(self, request):
+        prefetch_for_display((row.record for row in self.paginated_rows), request.user)
+
     def render_source(self, record):
         return link_to_object_html(record.source_content_object)
 
@@ -0,0 +1,29 @@
+import numpy as np
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from tokenizers.processors import TemplateProcessing
+
+from app.embedding_backends import EmbeddingBackend
+
+
+class FakeBackend(EmbeddingBackend):
+    """
+    Embedding backend with a word-level tokenizer that knows a single word, 'pear':
+    chunks mentioning pears point one way, everything else another.
+    """
+    PEAR = 3
+
+    def __init__(self, max_length: int = 512):
+        self.max_length = max_length
+        self.encoded = []
+
+    def get_tokenizer(self):
+        tokenizer = Tokenizer(WordLevel({'[UNK]': 0, '[CLS]': 1, '[SEP]': 2, 'pear': self.PEAR}, unk_token='[UNK]'))
+        tokenizer.pre_tokenizer = Whitespace() # type: ignore
+        tokenizer.post_processor = TemplateProcessing(single='[CLS] $A [SEP]', special_tokens=[('[CLS]', 1), ('[SEP]', 2)]) # type: ignore
+        return tokenizer
+
+    def encode_ids(self, token_ids: list[list[int]]) -> np.ndarray:
+        self.encoded.extend(token_ids)
+        return np.array([np.eye(384)[0 if self.PEAR in ids else 1] for ids in token_ids], dtype=np.float32)
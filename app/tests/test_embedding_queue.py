@@ -0,0 +1,115 @@
+from unittest import mock
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from app.embedding_queue import process_embedding_jobs
+from app.embeddings import get_similar_passages
+from app.models import EmbeddingJob, Link, LinkType, Memo, NodeChunk, Query, User
+from app.tests.fakes import FakeBackend
+
+
+@mock.patch('app.embeddings.get_backend', side_effect=FakeBackend)
+class EmbeddingQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+
+    def test_save_queues_instead_of_encoding(self, get_backend):
+        memo = Memo.objects.create(user=self.test_user, title="TestTitle", content="TestContent")
+        get_backend.assert_not_called()
+        self.assertTrue(EmbeddingJob.objects.filter(object_id=memo.pk).exists())
+
+        self.assertEqual(process_embedding_jobs(), 1)
+        memo.refresh_from_db()
+        self.assertIsNotNone(memo.embedding)
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+    def test_link_waits_for_its_endpoints(self, get_backend):
+        source = Memo.objects.create(user=self.test_user, title="Source", content="TestContent")
+        target = Memo.objects.create(user=self.test_user, title="Target", content="TestContent")
+        memo_type = ContentType.objects.get_for_model(Memo)
+        link_type = LinkType.objects.create(user=self.test_user, name="Supports", reverse_name="Supported by")
+        link = Link.objects.create(user=self.test_user, link_type=link_type,
+                                   source_content_type=memo_type, source_object_id=source.pk,
+                                   target_content_type=memo_type, target_object_id=target.pk)
+        EmbeddingJob.objects.filter(object_id__in=[source.pk, target.pk], content_type=memo_type).update(available_at='2100-01-01T00:00Z')
+
+        process_embedding_jobs()
+        link.refresh_from_db()
+        self.assertIsNone(link.embedding)
+
+        source.embedding = target.embedding = np.ones(384)
+        Memo.objects.bulk_update([source, target], ['embedding'])
+        EmbeddingJob.objects.update(available_at='2000-01-01T00:00Z')
+        process_embedding_jobs()
+        link.refresh_from_db()
+        self.assertIsNotNone(link.embedding)
+
+    def test_passages_are_stored_and_searched(self, get_backend):
+        memo = Memo.objects.create(user=self.test_user, title="Fruit", content="Notes on  pear trees")
+        process_embedding_jobs()
+        self.assertEqual([(chunk.start, chunk.end) for chunk in NodeChunk.objects.order_by('position')], [(0, 20), (None, None)])
+
+        [found] = get_similar_passages(Query('pears', np.eye(384)[0]), [Memo], self.test_user, 10)
+        self.assertEqual(found, memo)
+        self.assertEqual(found.passage, "Notes on  pear trees")
+        [found] = get_similar_passages(Query('fruit', np.eye(384)[1]), [Memo], self.test_user, 10)
+        self.assertIsNone(found.passage)
+
+    def test_only_changed_inputs_are_queued(self, get_backend):
+        memo = Memo.objects.create(user=self.test_user, title="TestTitle", content="TestContent")
+        process_embedding_jobs()
+        memo.refresh_from_db()
+
+        memo.privacy_setting = Memo.FRIENDS
+        memo.save()
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+        memo.content = "Edited content"
+        memo.save()
+        self.assertTrue(EmbeddingJob.objects.filter(object_id=memo.pk).exists())
+        process_embedding_jobs()
+
+        Memo.objects.filter(pk=memo.pk).update(title="Renamed")
+        self.assertFalse(EmbeddingJob.objects.exists())
+        self.assertEqual(Memo.objects.all().enqueue_stale_embeddings(), 1)
+        self.assertEqual(Memo.objects.all().enqueue_stale_embeddings(), 1)
+        process_embedding_jobs()
+        self.assertEqual(Memo.objects.all().enqueue_stale_embeddings(), 0)
+
+    def test_whitespace_edits_move_the_passages(self, get_backend):
+        memo = Memo.objects.create(user=self.test_user, title="Fruit", content="Notes on pear trees")
+        process_embedding_jobs()
+        memo.refresh_from_db()
+        memo.content = "\n\nNotes on pear trees"
+        memo.save()
+        process_embedding_jobs()
+
+        [found] = get_similar_passages(Query('pears', np.eye(384)[0]), [Memo], self.test_user, 10)
+        self.assertEqual(found.passage, "Notes on pear trees")
+
+    def test_edits_only_encode_changed_chunks(self, get_backend):
+        backend = FakeBackend()
+        get_backend.side_effect = None
+        get_backend.return_value = backend
+        paragraphs = [f"Paragraph {i} " + "word " * 200 for i in range(3)]
+        memo = Memo.objects.create(user=self.test_user, title="Long", content="\n\n".join(paragraphs))
+        process_embedding_jobs()
+        self.assertEqual(len(backend.encoded), 4)
+        chunk_ids = set(NodeChunk.objects.values_list('pk', flat=True))
+
+        memo.refresh_from_db()
+        paragraphs[1] = "A pear " + paragraphs[1]
+        memo.content = "\n\n".join(paragraphs)
+        memo.save()
+        process_embedding_jobs()
+        self.assertEqual(len(backend.encoded), 5)
+        self.assertIn(FakeBackend.PEAR, backend.encoded[-1])
+
+        # Only the edited paragraph's chunk is replaced; the one after it keeps its row, with its span moved
+        chunks = NodeChunk.objects.order_by('start')
+        self.assertEqual(len(chunk_ids - {chunk.pk for chunk in chunks}), 1)
+        self.assertEqual([memo.content[chunk.start:chunk.end] for chunk in chunks if chunk.start is not None],
+                         [paragraph.strip() for paragraph in paragraphs])
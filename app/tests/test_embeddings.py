@@ -0,0 +1,95 @@
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from app.embedding_cache import document_key
+from app.embeddings import (chunk_text, embed_query, fuse_rankings,
+                            rank_similar_passages, rank_text_matches)
+from app.models import Memo, NodeChunk, Query, QueryEmbedding, User
+from app.tests.fakes import FakeBackend
+
+
+class ChunkTextTest(TestCase):
+    @mock.patch('app.embeddings.get_backend', return_value=FakeBackend(max_length=4))
+    def test_windows_overlap_by_stride(self, get_backend):
+        text = "Notes on  pear trees"
+        chunks = chunk_text(text, stride=1)
+        self.assertEqual([text[chunk.start:chunk.end] for chunk in chunks], ["Notes on", "on  pear", "pear trees"])
+        self.assertEqual([chunk.token_ids for chunk in chunks], [[1, 0, 0, 2], [1, 0, 3, 2], [1, 3, 0, 2]])
+        self.assertEqual(chunk_text("   ", stride=1), [])
+
+    @mock.patch('app.embeddings.get_backend', return_value=FakeBackend())
+    def test_short_paragraphs_merge_into_runs(self, get_backend):
+        # 'fig' hashes to the end of a run
+        text = "Notes on\n\npear\n\n\nfig\n\nmore trees"
+        chunks = chunk_text(text)
+        self.assertEqual([text[chunk.start:chunk.end] for chunk in chunks], ["Notes on\n\npear\n\n\nfig", "more trees"])
+        self.assertEqual(chunks[0].token_ids, [1, 0, 0, 3, 0, 2])
+
+        # Inserting a paragraph only changes the chunk it is in
+        edited = "Notes on\n\npear\n\n\nfig\n\na pear\n\nmore trees"
+        self.assertEqual([chunk.token_ids for chunk in chunk_text(edited)], [chunks[0].token_ids, [1, 0, 3, 0, 0, 2]])
+
+    @override_settings(EMBEDDING_MIN_CHUNK_TOKENS=3)
+    @mock.patch('app.embeddings.get_backend', return_value=FakeBackend())
+    def test_long_paragraphs_are_chunks_of_their_own(self, get_backend):
+        text = "Notes on\n\nthree pear trees\n\nmore trees"
+        self.assertEqual([text[chunk.start:chunk.end] for chunk in chunk_text(text)], ["Notes on", "three pear trees", "more trees"])
+
+    def test_document_keys_keep_paragraph_breaks(self):
+        self.assertEqual(document_key("Notes on\n\n  pear trees \n"), document_key("Notes  on\n \npear trees"))
+        self.assertNotEqual(document_key("Notes on\n\npear trees"), document_key("Notes on pear trees"))
+
+
+class EmbedQueryTest(TestCase):
+    @mock.patch('app.embeddings.get_backend', return_value=FakeBackend())
+    def test_near_repeats_share_an_embedding(self, get_backend):
+        embedding = embed_query("Pear  Orchards")
+        encoded = len(get_backend.return_value.encoded)
+        self.assertTrue(np.array_equal(embed_query(" pear orchards "), embedding))
+        self.assertTrue(np.array_equal(embed_query("PÉAR orchards"), embedding))
+        self.assertEqual(len(get_backend.return_value.encoded), encoded)
+
+        entry = QueryEmbedding.objects.get()
+        self.assertEqual((entry.query, entry.hits), ("pear orchards", 3))
+
+
+class HybridSearchTest(TestCase):
+    def test_keys_ranked_by_both_rankings_come_first(self):
+        self.assertEqual([key for key, _score in fuse_rankings(['a', 'b', 'c'], ['c', 'd'])], ['c', 'a', 'b', 'd'])
+
+    def test_text_matches_rank_titles_first(self):
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass')
+        in_content = Memo.objects.create(user=user, title="Orchards", content="Notes on growing pears")
+        in_title = Memo.objects.create(user=user, title="Pear trees", content="Notes on growing them")
+        Memo.objects.create(user=user, title="Apples", content="")
+        Memo.objects.create(user=other_user, title="Pears", content="")
+        self.assertEqual([pk for _content_type_id, pk, _rank in rank_text_matches("pear", [Memo], user, 10)], [in_title.pk, in_content.pk])
+
+
+class SimilarPassagesTest(TestCase):
+    def test_the_index_scan_goes_past_other_users_nearer_chunks(self):
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass')
+        own = Memo.objects.create(user=user, title="Pears", content="")
+        other = Memo.objects.create(user=other_user, title="Pears", content="")
+        query = np.ones(384)
+        rng = np.random.default_rng(0)
+        memo_type = ContentType.objects.get_for_model(Memo)
+        NodeChunk.objects.bulk_create(
+            [NodeChunk(version=settings.EMBEDDING_MODEL_VERSION, content_type=memo_type, object_id=other.pk, position=position,
+                       embedding=query + rng.normal(0, 0.05, 384)) for position in range(100)]
+            + [NodeChunk(version=settings.EMBEDDING_MODEL_VERSION, content_type=memo_type, object_id=own.pk, position=0,
+                         embedding=query + rng.normal(0, 0.5, 384))])
+        with connection.cursor() as cursor:
+            # Make the search go through the HNSW index, as it would on a table with many users
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+        rows = rank_similar_passages(Query('pears', query), [Memo], user, 10)
+        self.assertEqual([pk for _content_type_id, pk, *_rest in rows], [own.pk])
+
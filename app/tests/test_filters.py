@@ -0,0 +1,32 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from app.filters import LinkFilter
+from app.models import Link, LinkType, Memo, User
+
+
+class LinkFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+        cls.source = Memo.objects.create(user=cls.test_user, title="Source", content="")
+        target = Memo.objects.create(user=cls.test_user, title="Target", content="")
+        memo_type = ContentType.objects.get_for_model(Memo)
+        link_type = LinkType.objects.create(user=cls.test_user, name="Supports", reverse_name="Supported by")
+        cls.link = Link.objects.create(user=cls.test_user, link_type=link_type,
+                                       source_content_type=memo_type, source_object_id=cls.source.pk,
+                                       target_content_type=memo_type, target_object_id=target.pk)
+
+    def search(self, value):
+        return list(LinkFilter(data=dict(search=value), queryset=Link.objects.all()).qs)
+
+    def test_search_matches_link_types_and_endpoint_titles(self):
+        self.assertEqual(self.search('support'), [self.link])
+        self.assertEqual(self.search('targ'), [self.link])
+        self.assertEqual(self.search('elsewhere'), [])
+
+    def test_endpoint_titles_follow_renames(self):
+        self.source.title = "Renamed"
+        self.source.save()
+        self.assertEqual(self.search('renamed'), [self.link])
+        self.assertEqual(self.search('source'), [])
@@ -0,0 +1,152 @@
+from unittest import mock
+
+import numpy as np
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app.models import EmbeddingJob, Memo, Tag, User, UserReach
+
+
+class UserReachTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        cls.bob = User.objects.create_user(username='bob', email='bob@example.com', password='testpass')
+        cls.carol = User.objects.create_user(username='carol', email='carol@example.com', password='testpass')
+
+    def befriend(self, sender, receiver):
+        sender.send_friend_request(receiver)
+        receiver.accept_friend_request(sender)
+
+    def reach(self):
+        return set(UserReach.objects.values_list('viewer__username', 'owner__username', 'distance'))
+
+    def test_accept_and_remove_friend_update_reach(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        self.assertEqual(self.reach(), {
+            ('alice', 'bob', 1), ('bob', 'alice', 1),
+            ('bob', 'carol', 1), ('carol', 'bob', 1),
+            ('alice', 'carol', 2), ('carol', 'alice', 2),
+        })
+
+        self.bob.remove_friend(self.alice)
+        self.assertEqual(self.reach(), {('bob', 'carol', 1), ('carol', 'bob', 1)})
+
+    def test_deleting_a_user_refreshes_the_reach_of_their_friends(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        self.assertEqual(self.reach(), set())
+
+    def test_privacy_filter_and_is_viewable_by(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        friends_memo = Memo.objects.create(user=self.alice, title='Friends', content='', privacy_setting=Memo.FRIENDS, embedding=[1] * 384)
+        fof_memo = Memo.objects.create(user=self.alice, title='FoF', content='', privacy_setting=Memo.FRIENDS_OF_FRIENDS, embedding=[1] * 384)
+
+        self.assertTrue(friends_memo.is_viewable_by(self.bob))
+        self.assertFalse(friends_memo.is_viewable_by(self.carol))
+        self.assertTrue(fof_memo.is_viewable_by(self.carol))
+        self.assertEqual(list(Memo.objects.filter(Memo.get_privacy_filter(self.carol, 'fof'))), [fof_memo])
+        self.assertEqual(set(Memo.objects.filter(Memo.get_privacy_filter(self.bob, 'friends'))), {friends_memo, fof_memo})
+
+
+class SimilarObjectsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        cls.query = np.ones(384)
+        # Nearest by cosine distance, but two dimensions fall on the wrong side of zero
+        nearest = np.ones(384)
+        nearest[:2] = -0.01
+        # Only one dimension on the wrong side, so nearest by Hamming distance
+        one_bit_off = np.ones(384)
+        one_bit_off[0] = -1
+        cls.nearest = Memo.objects.create(user=cls.user, title='Nearest', content='', embedding=nearest)
+        cls.one_bit_off = Memo.objects.create(user=cls.user, title='One bit off', content='', embedding=one_bit_off)
+        Memo.objects.create(user=cls.user, title='Opposite', content='', embedding=-np.ones(384))
+
+    def test_candidates_are_reranked_by_cosine_distance(self):
+        self.assertEqual(list(Memo.get_similar_objects(self.query, self.user, limit=2, candidates=0)), [self.nearest, self.one_bit_off])
+        self.assertEqual(list(Memo.get_similar_objects(self.query, self.user, limit=2, candidates=2)), [self.nearest, self.one_bit_off])
+        # Only the Hamming nearest candidate is ranked
+        self.assertEqual(list(Memo.get_similar_objects(self.query, self.user, limit=1, candidates=1)), [self.one_bit_off])
+        rows = Memo.get_similar_object_distances(self.query, self.user, limit=2, candidates=2)
+        self.assertEqual([pk for _content_type_id, pk, _distance in rows], [self.nearest.pk, self.one_bit_off.pk])
+
+    def test_the_index_scan_goes_past_other_users_nearer_objects(self):
+        other_user = User.objects.create_user(username='bob', email='bob@example.com', password='testpass')
+        rng = np.random.default_rng(0)
+        Memo.objects.bulk_create([Memo(user=other_user, title='Nearer', content='', embedding=self.query + rng.normal(0, 0.05, 384))
+                                  for _ in range(100)])
+        with connection.cursor() as cursor:
+            # Make the search go through the HNSW index, as it would on a table with many users
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+        found = Memo.get_similar_objects(self.query, self.user, limit=2, candidates=0)
+        self.assertEqual(list(found), [self.nearest, self.one_bit_off])
+        self.assertEqual(found.count(), 2)
+
+
+class HeavyFieldsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        Memo.objects.create(user=cls.user, title='Memo', content='A long document', embedding=np.ones(384))
+        Tag.objects.create(user=cls.user, name='tag', embedding=np.ones(384))
+
+    def test_default_querysets_defer_heavy_fields(self):
+        self.assertEqual(Memo.objects.get().get_deferred_fields(), {'embedding', 'content'})
+        self.assertEqual(self.user.memo_set.get().get_deferred_fields(), {'embedding', 'content'})
+        self.assertEqual(self.user.tag_set.get().get_deferred_fields(), {'embedding'})
+        self.assertEqual(Memo.objects.with_heavy_fields('embedding').get().get_deferred_fields(), {'content'})
+        self.assertEqual(Memo.objects.with_heavy_fields().get().get_deferred_fields(), set())
+
+    def test_list_pages_leave_out_heavy_fields(self):
+        self.client.force_login(self.user)
+        for url in [reverse('home'), reverse('memos'), reverse('references')]:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            selected = ' '.join(query['sql'].split(' FROM ')[0] for query in queries.captured_queries)
+            for column in ['"app_memo"."embedding"', '"app_memo"."content"', '"app_tag"."embedding"']:
+                self.assertNotIn(column, selected, url)
+
+
+class TagTest(TestCase):
+    def test_creating_many_tags_invalidates_the_owners_caches(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        Tag.get_or_create_many(user, ['Fruit', 'trees'])
+        user.refresh_from_db()
+        self.assertEqual((user.sidebar_version, user.corpus_version), (1, 1))
+
+        Tag.get_or_create_many(user, ['fruit'])
+        user.refresh_from_db()
+        self.assertEqual((user.sidebar_version, user.corpus_version), (1, 1))
+
+    def test_only_new_tags_are_queued(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        [fruit] = Tag.get_or_create_many(user, ['fruit'])
+        EmbeddingJob.objects.all().delete()
+        self.assertEqual([tag.name for tag in Tag.get_or_create_many(user, ['Pears', 'fruit'])], ['pears', 'fruit'])
+        self.assertEqual(list(EmbeddingJob.objects.values_list('object_id', flat=True)), [Tag.objects.get(name='pears').pk])
+
+    def test_tags_created_meanwhile_are_read_back(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        filter_tags = Tag.objects.filter
+        other_request_tags = []
+
+        def lookup_missing_a_concurrent_insert(*args, **kwargs):
+            if other_request_tags:
+                return filter_tags(*args, **kwargs)
+            other_request_tags.append(Tag(user=user, name='fruit'))
+            Tag.objects.bulk_create(other_request_tags)
+            return Tag.objects.none()
+
+        with mock.patch.object(Tag.objects, 'filter', side_effect=lookup_missing_a_concurrent_insert):
+            fruit, trees = Tag.get_or_create_many(user, ['fruit', 'trees'])
+        self.assertEqual(fruit, Tag.objects.get(name='fruit'))
+        self.assertEqual(trees, Tag.objects.get(name='trees'))
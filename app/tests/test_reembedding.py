@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from app.embedding_queue import process_embedding_jobs
+from app.models import (EmbeddingJob, Link, LinkType, Memo, NodeChunk,
+                        StagedEmbedding, User)
+from app.reembedding import activate, backfill, count_pending
+from app.tests.fakes import FakeBackend
+
+
+@mock.patch('app.embeddings.get_backend', side_effect=FakeBackend)
+class ReembedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+
+    def test_backfill_stages_until_activated(self, get_backend):
+        source = Memo.objects.create(user=self.test_user, title="Source", content="TestContent")
+        target = Memo.objects.create(user=self.test_user, title="Target", content="TestContent")
+        memo_type = ContentType.objects.get_for_model(Memo)
+        link_type = LinkType.objects.create(user=self.test_user, name="Supports", reverse_name="Supported by")
+        link = Link.objects.create(user=self.test_user, link_type=link_type,
+                                   source_content_type=memo_type, source_object_id=source.pk,
+                                   target_content_type=memo_type, target_object_id=target.pk)
+        while process_embedding_jobs():
+            pass
+
+        with override_settings(EMBEDDING_MODEL_VERSION='next'):
+            backfill(batch_size=1, log=lambda message: None)
+            self.assertEqual(StagedEmbedding.objects.count(), 3)
+            self.assertEqual(set(Memo.objects.values_list('embedding_version', flat=True)), {'bge-small-en-v1.5'})
+            self.assertEqual(set(NodeChunk.objects.values_list('version', flat=True)), {'bge-small-en-v1.5', 'next'})
+            self.assertFalse(any(count_pending().values()))
+
+            Memo.objects.filter(pk=source.pk).update(content="Edited after staging")
+            self.assertEqual(activate(batch_size=10), 1)
+            self.assertEqual(set(Memo.objects.values_list('embedding_version', flat=True)), {'next'})
+            self.assertEqual(Link.objects.get(pk=link.pk).embedding_version, 'next')
+            self.assertEqual(set(NodeChunk.objects.values_list('version', flat=True)), {'next'})
+            self.assertFalse(StagedEmbedding.objects.exists())
+            self.assertTrue(EmbeddingJob.objects.filter(object_id=source.pk, content_type=memo_type).exists())
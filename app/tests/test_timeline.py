@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+
+from app import timeline
+from app.models import Link, LinkType, Memo, TimelineEntry, User
+from app.timeline import process_timeline_jobs, rebuild_timeline
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        cls.bob = User.objects.create_user(username='bob', email='bob@example.com', password='testpass')
+        cls.carol = User.objects.create_user(username='carol', email='carol@example.com', password='testpass')
+
+    def befriend(self, sender, receiver):
+        sender.send_friend_request(receiver)
+        receiver.accept_friend_request(sender)
+
+    def process_jobs(self):
+        while process_timeline_jobs():
+            pass
+
+    def timeline(self, model_class=Memo):
+        entries = TimelineEntry.objects.filter(content_type=ContentType.objects.get_for_model(model_class))
+        titles = dict(model_class.objects.values_list('pk', 'title'))
+        return {(viewer, titles[object_id], distance) for viewer, object_id, distance in entries.values_list('viewer__username', 'object_id', 'privacy_level')}
+
+    def test_saves_fan_out_to_the_audience(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        self.process_jobs()
+        memo = Memo.objects.create(user=self.alice, title='Friends', content='', privacy_setting=Memo.FRIENDS)
+        Memo.objects.create(user=self.alice, title='Private', content='')
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {('alice', 'Friends', 0), ('bob', 'Friends', 1), ('alice', 'Private', 0)})
+
+        memo.privacy_setting = Memo.FRIENDS_OF_FRIENDS
+        memo.save()
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {('alice', 'Friends', 0), ('bob', 'Friends', 1), ('carol', 'Friends', 2), ('alice', 'Private', 0)})
+
+        memo.delete()
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {('alice', 'Private', 0)})
+
+    def test_friendships_rebuild_timelines(self):
+        Memo.objects.create(user=self.alice, title='FoF', content='', privacy_setting=Memo.FRIENDS_OF_FRIENDS)
+        self.process_jobs()
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {('alice', 'FoF', 0), ('bob', 'FoF', 1), ('carol', 'FoF', 2)})
+
+        self.bob.remove_friend(self.alice)
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {('alice', 'FoF', 0)})
+
+    def test_links_reach_those_who_see_both_endpoints(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.bob, self.carol)
+        source = Memo.objects.create(user=self.alice, title='Source', content='', privacy_setting=Memo.FRIENDS_OF_FRIENDS)
+        target = Memo.objects.create(user=self.bob, title='Target', content='', privacy_setting=Memo.FRIENDS)
+        memo_type = ContentType.objects.get_for_model(Memo)
+        link_type = LinkType.objects.create(user=self.alice, name='Supports', reverse_name='Supported by')
+        Link.objects.create(user=self.alice, link_type=link_type, source_content_type=memo_type, source_object_id=source.pk,
+                            target_content_type=memo_type, target_object_id=target.pk)
+        self.process_jobs()
+        link_entries = set(TimelineEntry.objects.filter(content_type=ContentType.objects.get_for_model(Link)).values_list('viewer__username', 'privacy_level'))
+        self.assertEqual(link_entries, {('alice', 1), ('bob', 1), ('carol', 2)})
+
+        target.privacy_setting = Memo.PRIVATE
+        target.save()
+        self.process_jobs()
+        link_entries = set(TimelineEntry.objects.filter(content_type=ContentType.objects.get_for_model(Link)).values_list('viewer__username', 'privacy_level'))
+        self.assertEqual(link_entries, {('bob', 1)})
+
+    @override_settings(HOME_FEED_CANDIDATES=2)
+    def test_timelines_keep_the_most_recent_entries_of_each_tab(self):
+        self.befriend(self.alice, self.bob)
+        self.process_jobs()
+        for title in ['First', 'Second', 'Third']:
+            Memo.objects.create(user=self.alice, title=title, content='', privacy_setting=Memo.FRIENDS)
+        Memo.objects.create(user=self.bob, title='Old', content='', privacy_setting=Memo.FRIENDS)
+        Memo.objects.filter(title='Old').update(updated_at='2000-01-01T00:00Z')
+        self.process_jobs()
+        self.assertEqual(self.timeline(), {
+            ('alice', 'Second', 0), ('alice', 'Third', 0), ('alice', 'Old', 1),
+            ('bob', 'Second', 1), ('bob', 'Third', 1), ('bob', 'Old', 0),
+        })
+
+    def test_rebuilds_keep_entries_fanned_out_meanwhile(self):
+        self.befriend(self.alice, self.bob)
+        self.process_jobs()
+        get_visible_entries = timeline._get_visible_entries
+
+        def fan_out_a_new_memo(viewer):
+            entries = get_visible_entries(viewer)
+            memo = Memo.objects.create(user=self.alice, title='New', content='', privacy_setting=Memo.FRIENDS)
+            timeline._fan_out([memo], {(ContentType.objects.get_for_model(Memo).pk, memo.pk)})
+            return entries
+
+        with mock.patch('app.timeline._get_visible_entries', side_effect=fan_out_a_new_memo):
+            rebuild_timeline(self.bob)
+        self.assertIn(('bob', 'New', 1), self.timeline())
+
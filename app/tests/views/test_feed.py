@@ -1,7 +1,12 @@
-from django.test import TestCase
+import numpy as np
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from app.models import Inkling, Memo, Query, Reference, Tag, User
+from app.timeline import process_timeline_jobs
 
 
 class BaseFeedViewTest(TestCase):
@@ -45,6 +50,32 @@ class MemoFeedViewTest(BaseFeedViewTest):
     def test_tag_feed_view(self):
         self.view_url_accessible_by_name('memo_view', [Memo.objects.first().pk]) # type: ignore
 
+    def test_feed_is_cached_until_the_corpus_changes(self):
+        cache.clear()
+        self.client.login(username='testuser', password='testpass')
+        memo = Memo.objects.get()
+        url = reverse('memo_view', args=[memo.pk])
+
+        def vector_searches():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            return [query for query in queries.captured_queries if '<=>' in query['sql']]
+
+        self.assertTrue(vector_searches())
+        self.assertFalse(vector_searches())
+        memo.save()
+        self.assertTrue(vector_searches())
+
+        friend = User.objects.create_user(username='friend', email='friend@example.com', password='testpass')
+        friend.send_friend_request(self.test_user)
+        self.test_user.accept_friend_request(friend)
+        self.assertTrue(vector_searches())
+        self.assertFalse(vector_searches())
+        corpus_version = User.objects.get(pk=self.test_user.pk).corpus_version
+        Memo.objects.create(user=friend, title="FriendTitle", content="TestContent", privacy_setting=Memo.FRIENDS)
+        self.assertEqual(User.objects.get(pk=self.test_user.pk).corpus_version, corpus_version)
+        self.assertTrue(vector_searches())
+
 
 class InklingFeedViewTest(BaseFeedViewTest):
     @classmethod
@@ -56,3 +87,36 @@ class InklingFeedViewTest(BaseFeedViewTest):
         self.view_url_accessible_by_name('inkling_view', [Inkling.objects.first().pk]) # type: ignore
 
 
+@override_settings(HOME_FEED_PAGE_SIZE=2)
+class HomeFeedViewTest(BaseFeedViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for title in ['First', 'Second', 'Third']:
+            Memo.objects.create(user=cls.test_user, title=title, content='')
+        process_timeline_jobs()
+
+    def feed_titles(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('home'))
+        pages = [[memo.title for memo in response.context['feed_objects_own']]]
+        next_page_url = response.context['next_page_url_own']
+        while next_page_url:
+            response = self.client.get(next_page_url)
+            pages.append([memo.title for memo in response.context['feed_objects']])
+            next_page_url = response.context['next_page_url']
+        return pages
+
+    def test_recent_objects_come_first_page_by_page(self):
+        self.assertEqual(self.feed_titles(), [['Third', 'Second'], ['First']])
+
+    def test_objects_near_the_intention_rank_higher(self):
+        intention = np.eye(384)[0]
+        User.objects.filter(pk=self.test_user.pk).update(intention_embedding=intention)
+        Memo.objects.filter(title='First').update(embedding=intention)
+        Memo.objects.exclude(title='First').update(embedding=np.eye(384)[1])
+        self.assertEqual(self.feed_titles(), [['First', 'Third'], ['Second']])
+
+    def test_unknown_tab(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertEqual(self.client.get(reverse('home_feed_page', args=['everyone'])).status_code, 404)
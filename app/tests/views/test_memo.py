@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app.models import Link, LinkType, Memo, User
+from app.views import MemoListView
+
+
+class MemoListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+        Memo.objects.create(user=cls.test_user, title="Orchards", content="Notes on growing pears")
+        Memo.objects.create(user=cls.test_user, title="Apples", content="")
+
+    def test_search_matches_words_of_title_and_content(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('memos'), data=dict(search='pear'))
+        self.assertContains(response, 'Orchards')
+        self.assertNotContains(response, 'Apples')
+
+    def test_rows_are_rendered_with_a_fixed_number_of_queries(self):
+        self.client.login(username='testuser', password='testpass')
+        link_type = LinkType.objects.create(user=self.test_user, name="Supports", reverse_name="Supported by")
+        memo_type = ContentType.objects.get_for_model(Memo)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('memos'))
+            return len(queries)
+
+        def add_linked_memos():
+            source = Memo.objects.create(user=self.test_user, title="Source", content="")
+            target = Memo.objects.create(user=self.test_user, title="Target", content="")
+            source.create_tags(["fruit", "trees"])
+            Link.objects.create(user=self.test_user, link_type=link_type,
+                                source_content_type=memo_type, source_object_id=source.pk,
+                                target_content_type=memo_type, target_object_id=target.pk)
+
+        add_linked_memos()
+        expected = count_queries()
+        for _ in range(3):
+            add_linked_memos()
+        self.assertEqual(count_queries(), expected)
+
+    def test_search_matches_parts_of_titles(self):
+        self.client.login(username='testuser', password='testpass')
+        self.assertContains(self.client.get(reverse('memos'), data=dict(search='orch')), 'Orchards')
+
+
+@mock.patch.object(MemoListView, 'page_size', 2)
+class MemoListPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+        for title in ['b', 'e', 'a', 'd', 'c']:
+            Memo.objects.create(user=cls.test_user, title=title, content='')
+
+    def list_pages(self, **query):
+        self.client.login(username='testuser', password='testpass')
+        pages = []
+        while query is not None:
+            response = self.client.get(reverse('memos'), data=query)
+            pages.append([row.record.title for row in response.context['table'].rows])
+            next_page_query = response.context.get('next_page_query')
+            query = QueryDict(next_page_query).dict() if next_page_query else None
+        return pages
+
+    def test_pages_follow_each_other(self):
+        self.assertEqual(self.list_pages(), [['c', 'd'], ['a', 'e'], ['b']])
+        self.assertEqual(self.client.get(reverse('memos')).context['object_count'], 5)
+
+    def test_pages_follow_the_sort_column(self):
+        self.assertEqual(self.list_pages(sort='title'), [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(self.list_pages(sort='-title'), [['e', 'd'], ['c', 'b'], ['a']])
+
+    def test_searches_are_paged_by_relevance(self):
+        for title in ['Pear', 'Pears and pear trees', 'Apple']:
+            Memo.objects.create(user=self.test_user, title=title, content='pear')
+        self.assertEqual(self.list_pages(search='pear'), [['Pears and pear trees', 'Pear'], ['Apple']])
+
+    def test_search_ties_continue_across_pages(self):
+        for title in ['Fig 1', 'Fig 2', 'Fig 3']:
+            Memo.objects.create(user=self.test_user, title=title, content='figs and more figs')
+        self.assertEqual(self.list_pages(search='figs'), [['Fig 3', 'Fig 2'], ['Fig 1']])
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app.models import Memo, User
+
+
+@override_settings(SIDEBAR_PAGE_SIZE=2)
+class SidebarViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', password='testpass')
+        for title in ['First', 'Second', 'Third']:
+            Memo.objects.create(user=cls.test_user, title=title, content='')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser', password='testpass')
+
+    def test_pages_dont_list_the_library(self):
+        response = self.client.get(reverse('memo_view', args=[Memo.objects.get(title='First').pk]))
+        self.assertNotContains(response, 'Second')
+        self.assertContains(response, reverse('sidebar_page', args=['memos']))
+
+    def test_sidebar_is_paginated_and_cached_until_a_memo_changes(self):
+        url = reverse('sidebar_page', args=['memos'])
+        first_page = self.client.get(url)
+        self.assertEqual([title in first_page.content.decode() for title in ['Third', 'Second', 'First']], [True, True, False])
+        self.assertContains(first_page, f'{url}?page=2')
+        self.assertContains(self.client.get(url, data=dict(page=2)), 'First')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries.captured_queries if 'app_memo' in query['sql']])
+
+        Memo.objects.filter(title='Third').get().delete()
+        self.assertContains(self.client.get(url), 'First')
+
+    def test_only_new_titles_invalidate_the_sidebar(self):
+        memo = Memo.objects.get(title='First')
+        version = User.objects.get().sidebar_version
+        memo.content = 'Edited'
+        memo.save()
+        self.assertEqual(User.objects.get().sidebar_version, version)
+
+        memo.title = 'Renamed'
+        memo.save()
+        self.assertEqual(User.objects.get().sidebar_version, version + 1)
+
+    def test_unknown_section(self):
+        self.assertEqual(self.client.get(reverse('sidebar_page', args=['users'])).status_code, 404)
@@ -0,0 +1,27 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from app.models import Memo, Tag, User
+
+
+class TagPickerViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass')
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass')
+        Tag.objects.create(user=cls.test_user, name='orchards')
+        Tag.objects.create(user=other_user, name='vineyards')
+        cls.memo = Memo.objects.create(user=cls.test_user, title='Pear trees', content='')
+
+    def setUp(self):
+        self.client.login(username='testuser', password='testpass')
+
+    def test_pages_leave_the_tags_to_the_picker(self):
+        response = self.client.get(reverse('memo_view', args=[self.memo.pk]))
+        self.assertContains(response, reverse('tag_options'))
+        self.assertNotContains(response, 'orchards')
+
+    def test_picker_lists_the_users_tags(self):
+        response = self.client.get(reverse('tag_options'))
+        self.assertContains(response, f'<option value="{Tag.objects.get(name="orchards").pk}">orchards</option>', html=True)
+        self.assertNotContains(response, 'vineyards')
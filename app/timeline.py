@@ -0,0 +1,179 @@
+from collections import defaultdict
+from typing import Iterable
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.db.models import Q, Window
+from django.db.models.functions import RowNumber
+
+from .job_queue import claim_jobs, complete_jobs, retry_jobs_later
+from .models import (Inkling, Link, Memo, PrivacySettingsModel, Reference,
+                     TimelineEntry, TimelineJob, User, UserReach,
+                     prefetch_link_endpoints)
+
+TIMELINE_CLASSES = [Memo, Reference, Link, Inkling]
+# Furthest social distance from the viewer that each home feed tab shows
+TAB_DISTANCES = {'own': TimelineEntry.OWN, 'friends': UserReach.FRIEND, 'fof': UserReach.FRIEND_OF_FRIEND}
+# Furthest social distance from the owner at which an object of each privacy setting is visible
+SETTING_DISTANCES = {
+    PrivacySettingsModel.PRIVATE: TimelineEntry.OWN,
+    PrivacySettingsModel.FRIENDS: UserReach.FRIEND,
+    PrivacySettingsModel.FRIENDS_OF_FRIENDS: UserReach.FRIEND_OF_FRIEND,
+}
+
+
+def enqueue_timeline(obj: models.Model):
+    TimelineJob.enqueue([obj])
+
+
+def process_timeline_jobs(batch_size: int = 256) -> int:
+    """
+    Claim a batch of jobs and bring the timelines they affect up to date: saved nodes and links are written to the
+    timelines of everyone who can see them, deleted ones are removed from all timelines, and users whose reach changed
+    get their timeline rebuilt. Returns the number of jobs claimed.
+    """
+    jobs = claim_jobs(TimelineJob, batch_size)
+    if not jobs:
+        return 0
+    try:
+        objects = _load_job_objects(jobs)
+        users = [obj for obj in objects if isinstance(obj, User)]
+        items = [obj for obj in objects if not isinstance(obj, User)]
+        user_content_type = ContentType.objects.get_for_model(User)
+        item_keys = {(job.content_type_id, job.object_id) for job in jobs if job.content_type_id != user_content_type.pk} # type: ignore
+        _fan_out(items, item_keys)
+        # A link is visible where both of its endpoints are, so a node's links follow it
+        _enqueue_links_of({key for key in item_keys if ContentType.objects.get_for_id(key[0]).model_class() is not Link})
+        for user in users:
+            rebuild_timeline(user)
+    except Exception as e:
+        retry_jobs_later(jobs, error=repr(e))
+        raise
+    complete_jobs(jobs)
+    return len(jobs)
+
+
+def rebuild_timeline(viewer: User):
+    """
+    Bring the viewer's timeline up to date, e.g. after their reach changed, with the entries of _get_visible_entries().
+    Entries that fan-outs write while the rebuild runs are kept: only those that were there before it started, and
+    haven't changed since, are deleted.
+    """
+    existing = {(content_type_id, object_id): ts for content_type_id, object_id, ts
+                in TimelineEntry.objects.filter(viewer=viewer).values_list('content_type_id', 'object_id', 'ts')}
+    entries = _get_visible_entries(viewer)
+    visible = {(entry.content_type_id, entry.object_id) for entry in entries}
+    stale = Q()
+    for (content_type_id, object_id), ts in existing.items():
+        if (content_type_id, object_id) not in visible:
+            stale |= Q(content_type_id=content_type_id, object_id=object_id, ts=ts)
+    with transaction.atomic():
+        if stale:
+            TimelineEntry.objects.filter(stale, viewer=viewer).delete()
+        TimelineEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['viewer', 'content_type', 'object_id'],
+                                          update_fields=['privacy_level', 'ts'])
+
+
+def _get_visible_entries(viewer: User) -> list[TimelineEntry]:
+    """
+    The entries of the viewer's timeline: of each class, the settings.HOME_FEED_CANDIDATES most recently updated
+    objects of every tab, which is all that a tab ranks.
+    """
+    entries = []
+    for feed_class in TIMELINE_CLASSES:
+        content_type_id = ContentType.objects.get_for_model(feed_class).pk
+        updated_at_by_pk = dict()
+        for tab in TAB_DISTANCES:
+            updated_at_by_pk.update(feed_class.objects
+                                    .filter(feed_class.get_privacy_filter(viewer, tab))
+                                    .order_by('-updated_at')
+                                    .values_list('pk', 'updated_at')[:settings.HOME_FEED_CANDIDATES])
+        # The distance of an object is that of the narrowest tab that shows it
+        distances = dict()
+        for tab, distance in TAB_DISTANCES.items():
+            for pk in feed_class.objects.filter(feed_class.get_privacy_filter(viewer, tab), pk__in=updated_at_by_pk).values_list('pk', flat=True):
+                distances.setdefault(pk, distance)
+        entries.extend(TimelineEntry(viewer=viewer, content_type_id=content_type_id, object_id=pk, privacy_level=distance, ts=updated_at_by_pk[pk])
+                       for pk, distance in distances.items())
+    return entries
+
+
+def _load_job_objects(jobs: list[TimelineJob]) -> list[models.Model]:
+    pks_by_content_type = defaultdict(list)
+    for job in jobs:
+        pks_by_content_type[job.content_type_id].append(job.object_id) # type: ignore
+    objects = []
+    for content_type_id, pks in pks_by_content_type.items():
+        objects.extend(ContentType.objects.get_for_id(content_type_id).model_class().objects.filter(pk__in=pks)) # type: ignore
+    prefetch_link_endpoints(objects)
+    return objects
+
+
+def _fan_out(objects: list[models.Model], keys: set[tuple[int, int]]):
+    """
+    Write an entry for each object to the timeline of everyone who can see it, and remove it from the timelines of
+    everyone else. `keys` are the (content type, pk) of every object to update, including those that no longer exist.
+    """
+    owner_ids = {obj.user_id for obj in objects if not isinstance(obj, Link)} # type: ignore
+    owner_ids.update(end.user_id for obj in objects if isinstance(obj, Link) # type: ignore
+                     for end in [obj.source_content_object, obj.target_content_object] if end is not None)
+    reach = defaultdict(dict)
+    for owner_id, viewer_id, distance in UserReach.objects.filter(owner_id__in=owner_ids).values_list('owner_id', 'viewer_id', 'distance'):
+        reach[owner_id][viewer_id] = distance
+
+    audiences = {key: dict() for key in keys}
+    entries = []
+    for obj in objects:
+        content_type_id = ContentType.objects.get_for_model(obj).pk
+        audience = audiences[(content_type_id, obj.pk)] = _get_audience(obj, reach)
+        entries.extend(TimelineEntry(viewer_id=viewer_id, content_type_id=content_type_id, object_id=obj.pk, privacy_level=distance, ts=obj.updated_at) # type: ignore
+                       for viewer_id, distance in audience.items())
+    with transaction.atomic():
+        for (content_type_id, object_id), audience in audiences.items():
+            TimelineEntry.objects.filter(content_type_id=content_type_id, object_id=object_id).exclude(viewer_id__in=audience).delete()
+        TimelineEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['viewer', 'content_type', 'object_id'],
+                                          update_fields=['privacy_level', 'ts'])
+    _prune({entry.viewer_id for entry in entries}, {entry.content_type_id for entry in entries})
+
+
+def _prune(viewer_ids: set[int], content_type_ids: set[int]):
+    """
+    Delete the entries of the given timelines and classes that no tab would rank: those beyond the
+    settings.HOME_FEED_CANDIDATES most recent at each distance, which include the most recent of every tab.
+    """
+    if not viewer_ids:
+        return
+    recency_rank = Window(RowNumber(), partition_by=['viewer', 'content_type', 'privacy_level'], order_by='-ts')
+    old_entries = (TimelineEntry.objects
+                   .filter(viewer_id__in=viewer_ids, content_type_id__in=content_type_ids)
+                   .annotate(recency_rank=recency_rank)
+                   .filter(recency_rank__gt=settings.HOME_FEED_CANDIDATES)
+                   .values_list('pk', flat=True))
+    TimelineEntry.objects.filter(pk__in=list(old_entries)).delete()
+
+
+def _get_audience(obj: models.Model, reach: dict[int, dict[int, int]]) -> dict[int, int]:
+    """
+    The social distance from each user who can see `obj` to it. A link is only visible to those who can see both of
+    its endpoints, and only on the tabs that show both.
+    """
+    if isinstance(obj, Link):
+        source, target = obj.source_content_object, obj.target_content_object
+        if source is None or target is None:
+            return dict()
+        source_audience, target_audience = _get_audience(source, reach), _get_audience(target, reach)
+        return {viewer_id: max(distance, target_audience[viewer_id]) for viewer_id, distance in source_audience.items() if viewer_id in target_audience}
+    max_distance = SETTING_DISTANCES.get(obj.privacy_setting, TimelineEntry.OWN) # type: ignore
+    audience = {viewer_id: distance for viewer_id, distance in reach[obj.user_id].items() if distance <= max_distance} # type: ignore
+    audience[obj.user_id] = TimelineEntry.OWN # type: ignore
+    return audience
+
+
+def _enqueue_links_of(node_keys: Iterable[tuple[int, int]]):
+    endpoint_filter = Q()
+    for content_type_id, object_id in node_keys:
+        endpoint_filter |= Q(source_content_type_id=content_type_id, source_object_id=object_id)
+        endpoint_filter |= Q(target_content_type_id=content_type_id, target_object_id=object_id)
+    if endpoint_filter:
+        TimelineJob.enqueue(Link.objects.filter(endpoint_filter).only('pk'))
@@ -5,5 +5,6 @@ from .link_types import *
 from .links import *
 from .memos import *
 from .references import *
+from .sidebar import *
 from .tables import *
 from .tags import *
@@ -12,7 +12,7 @@ from django.views.generic import (CreateView, DetailView, ListView, UpdateView,
                                   View)
 
 from app.config import DEFAULT_LINK_TYPES, DEFAULT_TAGS
-from app.embeddings import generate_embedding
+from app.embedding_queue import enqueue_embedding
 from app.forms import FriendRequestForm, UserCreationForm
 from app.mixins import UserScopedMixin
 from app.models import FriendRequest, LinkType, Memo, Tag, User, UserInvite
@@ -48,8 +48,8 @@ def get_intention(request):
         user = request.user
         intention = request.POST.get('intention')
         user.intention = intention
-        user.intention_embedding = generate_embedding(intention)
         user.save()
+        enqueue_embedding(user)
         initial_data = create_initial_data(ChatGPT(), intention, DEFAULT_TAGS, DEFAULT_LINK_TYPES)
         tags = initial_data.get('tags')
         if not tags:
@@ -57,10 +57,11 @@ def get_intention(request):
         link_types = initial_data.get('link_types')
         if not link_types:
             link_types = DEFAULT_LINK_TYPES
-        for tag_name in tags:
-            Tag.objects.create(name=tag_name, user=user)
-        for forward_name, reverse_name in link_types:
-            LinkType.objects.create(name=forward_name, reverse_name=reverse_name, user=user)
+        Tag.get_or_create_many(user, tags)
+        LinkType.objects.bulk_create([
+            LinkType(name=forward_name, reverse_name=reverse_name, user=user)
+            for forward_name, reverse_name in link_types
+        ], ignore_conflicts=True)
         return redirect('home')
     return render(request, 'auth/intentions_form.html')
 
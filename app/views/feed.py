@@ -1,14 +1,55 @@
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Sum
+from django.http import Http404
 from django.shortcuts import render
+from django.urls import reverse
 from django.views import View
 from django.views.generic import DetailView
 
-from app.embeddings import (generate_embedding, get_similar_nodes,
-                            get_similar_tags, sort_by_distance)
+from app.embedding_cache import query_key
+from app.embeddings import (embed_query, get_similar_tags,
+                            load_ranked_objects, load_ranked_passages,
+                            rank_hybrid_search, rank_similar_nodes_across)
 from app.forms import InklingForm
+from app.home_feed import rank_home_feed
 from app.mixins import LinkedContentMixin, PrivacyScopedMixin, UserScopedMixin
-from app.models import Inkling, Link, Memo, Query, Reference, Tag
+from app.models import (Inkling, Link, Memo, Query, Reference, Tag, User,
+                        UserReach, prefetch_for_display)
+
+
+PRIVACY_LEVELS = ['own', 'friends', 'fof']
+
+
+def get_corpus_version(user: User) -> str:
+    """
+    Version of everything the user's feeds are ranked from: the user's own corpus_version, which changes with their
+    content and their reach, and the sum of the corpus_versions of the owners they reach, which changes whenever any
+    of those owners' content does. Versions only grow, so while the reach stays the same the sum never repeats.
+    """
+    if not hasattr(user, '_corpus_version'):
+        reach_version = UserReach.objects.filter(viewer=user).aggregate(version=Sum('owner__corpus_version'))['version'] or 0
+        user._corpus_version = f'{user.corpus_version}.{reach_version}' # type: ignore
+    return user._corpus_version # type: ignore
+
+
+def get_cached_feed_rows(user: User, origin_key: str, name: str, rank: Callable[[], list]) -> list:
+    """
+    Rows (ids and distances) of one of the user's feeds, ranked by `rank` if they aren't cached for the user's
+    current get_corpus_version(). Anything that could change the rows changes that version, so entries are never stale.
+    """
+    key = f'feed:{user.pk}:{get_corpus_version(user)}:{origin_key}:{name}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = rank()
+        cache.set(key, rows, settings.FEED_CACHE_TIMEOUT)
+    return rows
 
 
 class FeedContentMixin(LinkedContentMixin):
@@ -16,22 +57,35 @@ class FeedContentMixin(LinkedContentMixin):
         context = super().get_context_data(**kwargs)
         object = self.object # type: ignore
         user = self.request.user # type: ignore
+        origin_key = self.get_origin_key(object)
         context['current_user'] = user
         context['hatch_inkling_form'] = InklingForm()
-        context['similar_tags'] = get_similar_tags(object, user, 10)
-        for privacy_level in ['own', 'friends', 'fof']:
-            feed_objects = []
-            for search_class in [Reference, Inkling, Memo]:
-                similar_nodes = get_similar_nodes(object, search_class, user, 10, privacy_level=privacy_level)
-                feed_objects.extend(similar_nodes)
-            feed_objects = sort_by_distance(object.embedding, feed_objects)
-            context[f'feed_objects_{privacy_level}'] = feed_objects
+        tag_pks = get_cached_feed_rows(user, origin_key, 'tags', lambda: list(get_similar_tags(object, user, 10).values_list('pk', flat=True)))
+        tags = Tag.objects.in_bulk(tag_pks)
+        context['similar_tags'] = [tags[pk] for pk in tag_pks if pk in tags]
+        feed_objects = []
+        for privacy_level in PRIVACY_LEVELS:
+            rows = get_cached_feed_rows(user, origin_key, privacy_level, lambda: self.rank_feed_objects(object, user, privacy_level))
+            context[f'feed_objects_{privacy_level}'] = self.load_feed_objects(rows)
+            feed_objects.extend(context[f'feed_objects_{privacy_level}'])
+        prefetch_for_display(feed_objects, user)
         return context
 
+    def get_origin_key(self, object) -> str:
+        return f'{ContentType.objects.get_for_model(object).pk}:{object.pk}'
+
+    def rank_feed_objects(self, object, user, privacy_level) -> list:
+        return rank_similar_nodes_across(object, [Reference, Inkling, Memo], user, 30, privacy_level=privacy_level)
+
+    def load_feed_objects(self, rows: list) -> list:
+        return load_ranked_objects(rows)
+
 
 
 class FeedView(LoginRequiredMixin, PrivacyScopedMixin, FeedContentMixin, DetailView):
-    pass
+    def get_queryset(self):
+        # The page shows the object in full, and searches with its embedding
+        return super().get_queryset().with_heavy_fields()
 
 
 class TagFeedView(FeedView):
@@ -65,30 +119,48 @@ class QueryFeedView(FeedView):
 
     def get_object(self, queryset=None):
         query = self.request.GET.get('query')
-        embedding = generate_embedding(query)
+        embedding = embed_query(query)
         return Query(query, embedding) # type: ignore
 
+    def get_origin_key(self, object) -> str:
+        return f'query:{query_key(object.query)}'
+
+    def rank_feed_objects(self, object, user, privacy_level) -> list:
+        # A short query is best matched against single passages, so long references aren't blurred into one vector,
+        # and against the words of each node, so exact keyword matches aren't missed
+        return rank_hybrid_search(object, [Reference, Inkling, Memo], user, 30, privacy_level=privacy_level)
+
+    def load_feed_objects(self, rows: list) -> list:
+        return load_ranked_passages(rows)
+
+
+def get_home_feed_page(user: User, privacy_level: str, cursor: Optional[str] = None) -> dict:
+    """
+    Context of one page of a home feed tab: its objects, and the URL of the next page if there is one.
+    """
+    rows, next_cursor = rank_home_feed(user, privacy_level, cursor, settings.HOME_FEED_PAGE_SIZE)
+    next_page_url = None
+    if next_cursor:
+        next_page_url = f"{reverse('home_feed_page', args=[privacy_level])}?{urlencode(dict(after=next_cursor))}"
+    return dict(feed_objects=prefetch_for_display(load_ranked_objects(rows), user), next_page_url=next_page_url)
+
 
 @login_required
 def new_feed_view(request):
     context = dict()
     user = request.user
     context['current_user'] = user
-    for privacy_level in ['own', 'friends', 'fof']:
-        feed_objects = []
+    for privacy_level in PRIVACY_LEVELS:
+        page = get_home_feed_page(user, privacy_level)
+        context[f'feed_objects_{privacy_level}'] = page['feed_objects']
+        context[f'next_page_url_{privacy_level}'] = page['next_page_url']
+    return render(request, 'feed/feed_new.html', context=context)
 
-        for search_class in [Memo, Reference, Link, Inkling]:
-            recent = search_class.objects.filter(search_class.get_privacy_filter(user, privacy_level)).order_by('-updated_at')[:20]
-            feed_objects.extend(recent)
-
-        feed_objects = sorted(feed_objects, key=lambda x: x.updated_at, reverse=True)
-
-        if user.intention_embedding is not None:
-            sorted_feed_objects = []
-            subsort_size = 10
-            for i in range(0, len(feed_objects), subsort_size):
-                sorted_feed_objects.extend(sort_by_distance(user.intention_embedding, feed_objects[i:i+subsort_size]))
-            feed_objects = sorted_feed_objects
-        
-        context[f'feed_objects_{privacy_level}'] = feed_objects
-    return render(request, 'feed/feed_new.html', context=context)
\ No newline at end of file
+
+@login_required
+def home_feed_page(request, privacy_level):
+    if privacy_level not in PRIVACY_LEVELS:
+        raise Http404()
+    context = get_home_feed_page(request.user, privacy_level, request.GET.get('after'))
+    context['current_user'] = request.user
+    return render(request, 'feed/_page.html', context=context)
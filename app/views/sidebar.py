@@ -0,0 +1,15 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse
+
+from app.sidebar import SECTIONS, render_sidebar_page
+
+
+@login_required
+def sidebar_page(request, section):
+    if section not in SECTIONS:
+        raise Http404()
+    try:
+        page_number = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page_number = 1
+    return HttpResponse(render_sidebar_page(request.user, section, page_number))
@@ -1,14 +1,64 @@
+from django.conf import settings
 from django_filters.views import FilterView
 from django_tables2 import SingleTableMixin
+from django_tables2.data import TableListData
 
 from app.filters import (InklingFilter, LinkFilter, LinkTypeFilter, MemoFilter,
                          ReferenceFilter, TagFilter)
 from app.models import Inkling, Link, LinkType, Memo, Reference, Tag
+from app.pagination import estimate_count, keyset_page
 from app.tables import (InklingTable, LinkTable, LinkTypeTable, MemoTable,
                         ReferenceTable, TagTable)
 
 
-class BaseNodeListView(SingleTableMixin, FilterView):
+class KeysetPageData(TableListData):
+    """
+    Rows of one keyset page, which the database has already put in the table's order.
+    """
+    def order_by(self, aliases):
+        pass
+
+
+class KeysetTableMixin:
+    """
+    Pages the table by keyset (see app.pagination.keyset_page) instead of django_tables2's OFFSET pagination and exact count.
+    Rows are ordered by the table's sort column if it is a non-null field of the model, otherwise by relevance when the list
+    is searched (see TitleAndContentModel.text_search), and by `default_ordering` when it isn't.
+    Adds `next_page_query` and `first_page_query` for the pager, and the (estimated) length of the list as `object_count`.
+    """
+    table_pagination = False
+    default_ordering = ['-updated_at', '-pk']
+    page_size = settings.LIST_PAGE_SIZE
+
+    def get_table_data(self):
+        queryset = super().get_table_data() # type: ignore
+        page = keyset_page(queryset, self.get_keyset_ordering(queryset), self.request.GET.get('after'), self.page_size) # type: ignore
+        self.next_cursor = page.next_cursor
+        return KeysetPageData(page.objects)
+
+    def get_keyset_ordering(self, queryset) -> list[str]:
+        sort = self.request.GET.get('sort', '') # type: ignore
+        name = sort.lstrip('-')
+        column = self.table_class.base_columns.get(name) # type: ignore
+        field = next((field for field in self.model._meta.concrete_fields if field.name == name), None) # type: ignore
+        if column is None or column.orderable is False or field is None or field.null:
+            return ['-text_rank', '-pk'] if 'text_rank' in queryset.query.annotations else self.default_ordering
+        return [sort, '-pk' if sort.startswith('-') else 'pk']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs) # type: ignore
+        context['object_count'], context['object_count_is_exact'] = estimate_count(self.object_list, settings.LIST_EXACT_COUNT_BELOW) # type: ignore
+        query = self.request.GET.copy() # type: ignore
+        query.pop('after', None)
+        if 'after' in self.request.GET: # type: ignore
+            context['first_page_query'] = query.urlencode()
+        if self.next_cursor:
+            query['after'] = self.next_cursor
+            context['next_page_query'] = query.urlencode()
+        return context
+
+
+class BaseNodeListView(KeysetTableMixin, SingleTableMixin, FilterView):
     template_name = "layouts/base_list_view.html"
     
     def get_queryset(self):
@@ -46,7 +96,7 @@ class LinkListView(SingleTableMixin, FilterView):
     template_name = "layouts/base_list_view.html"
 
     def get_queryset(self):
-        return super().get_queryset().filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user).select_related('link_type')
 
 
 class TagListView(SingleTableMixin, FilterView):
@@ -1,10 +1,9 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.views.generic import DeleteView, UpdateView
 
-from app.embeddings import generate_embedding
 from app.forms import TagForm
 from app.mixins import RedirectBackMixin, UserScopedMixin
 from app.models import Inkling, Memo, Tag
@@ -65,7 +64,6 @@ def merge_tags(request):
 
     if new_name:
         current_tag.name = new_name
-        current_tag.embedding = generate_embedding(new_name)
         current_tag.save()
 
     return redirect('tag_view', current_tag.id)  # type: ignore
@@ -84,3 +82,12 @@ def add_tag(request):
         target_object.tags.add(tag)
         return redirect(target_object.get_absolute_url())
     return redirect(tag.get_absolute_url())
+
+
+@login_required
+def tag_options(request):
+    """
+    The options of the add-tag form's tag picker, which fetches them when it is first opened,
+    so that pages don't list every tag in the form of every card.
+    """
+    return render(request, 'tag/_options.html', dict(tags=request.user.tag_set.only('pk', 'name')))
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_tables2',
     'django_filters',
 ]
@@ -104,6 +105,18 @@ DATABASES = {
     'default': database_config 
 }
 
+# Shared by every process, so that invalidating an entry takes effect everywhere. Create the table with manage.py createcachetable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            # Sidebar pages and feed rows are cached per user; the default of 300 entries would cull on almost every set
+            'MAX_ENTRIES': 200000,
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -232,3 +245,57 @@ ALLOWED_HTML_ATTRIBUTES = [
 CSRF_COOKIE_HTTPONLY = False
 
 DJANGO_TABLES2_TEMPLATE = "django_tables2/bootstrap5.html"
+
+# Embeddings
+EMBEDDING_MODEL_NAME = os.environ.get('EMBEDDING_MODEL_NAME', 'BAAI/bge-small-en-v1.5')
+# Names the vectors the model, chunking and pooling produce together. Change it whenever any of them changes,
+# and migrate the stored embeddings with manage.py reembed.
+EMBEDDING_MODEL_VERSION = os.environ.get('EMBEDDING_MODEL_VERSION', 'bge-small-en-v1.5')
+# Size of the in-process cache in front of the embedding cache table
+EMBEDDING_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# How long a search query's embedding is reused before it is encoded again
+QUERY_EMBEDDING_TTL = 30 * 24 * 60 * 60
+# 'torch' runs the sentence-transformers model, 'onnx' the int8 export made by manage.py export_onnx_encoder
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_DIR = os.environ.get('EMBEDDING_ONNX_DIR', BASE_DIR / 'onnx' / 'bge-small-en-v1.5')
+# Chunks are runs of paragraphs of at most EMBEDDING_MAX_TOKENS tokens (the encoder's limit). Paragraphs of at least
+# EMBEDDING_MIN_CHUNK_TOKENS tokens are chunks of their own, and shorter ones are merged about EMBEDDING_CHUNK_PARAGRAPHS
+# to a chunk. Longer paragraphs are cut into windows overlapping by EMBEDDING_CHUNK_STRIDE tokens.
+EMBEDDING_MAX_TOKENS = 512
+EMBEDDING_MIN_CHUNK_TOKENS = 64
+EMBEDDING_CHUNK_PARAGRAPHS = 4
+EMBEDDING_CHUNK_STRIDE = 64
+# Padded tokens per encoder forward pass
+EMBEDDING_BATCH_TOKENS = 8192
+# Shared embedding server (manage.py embedding_server), e.g. http://127.0.0.1:8765. Encodes in-process when unset or unreachable.
+EMBEDDING_SERVER_URL = os.environ.get('EMBEDDING_SERVER_URL')
+# Similarity searches with a limit first pick this many candidates by the Hamming distance of the binary-quantized
+# embeddings, then rank only those by cosine distance. 0 ranks every visible object through the halfvec index.
+EMBEDDING_SEARCH_CANDIDATES = int(os.environ.get('EMBEDDING_SEARCH_CANDIDATES', 0))
+# An HNSW index returns its nearest rows before the privacy and other filters of a search drop some of them. pgvector 0.8
+# and later keeps scanning until enough rows pass ('strict_order' keeps them ordered by distance); on older versions set
+# this to '', and filtered searches read EMBEDDING_FILTERED_EF_SEARCH rows from the index instead.
+EMBEDDING_ITERATIVE_SCAN = os.environ.get('EMBEDDING_ITERATIVE_SCAN', 'strict_order')
+EMBEDDING_FILTERED_EF_SEARCH = 400
+
+# Sidebar
+SIDEBAR_PAGE_SIZE = 50
+# Rendered sidebar pages are also invalidated whenever the objects they list change
+SIDEBAR_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Feeds
+# Ranked feed rows are cached per viewer and corpus_version, which every change they could depend on bumps
+FEED_CACHE_TIMEOUT = 24 * 60 * 60
+HOME_FEED_PAGE_SIZE = 20
+# The home feed ranks this many of the most recently updated objects of each class; timelines keep as many
+# of each class per tab
+HOME_FEED_CANDIDATES = 200
+# Recency halves every this many hours
+HOME_FEED_HALF_LIFE_HOURS = 72
+# Share of the home feed score that comes from similarity to the user's intention, the rest from recency
+HOME_FEED_INTENTION_WEIGHT = 0.5
+
+# List views
+LIST_PAGE_SIZE = 25
+# Lists the planner expects to be at least this long show its estimate of their length instead of counting them
+LIST_EXACT_COUNT_BELOW = 10000
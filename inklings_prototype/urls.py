@@ -6,6 +6,7 @@ from app import views
 
 urlpatterns = [
     path('', views.new_feed_view, name='home'),
+    path('feed/<str:privacy_level>/', views.home_feed_page, name='home_feed_page'),
     
     path('admin/', admin.site.urls),
     path('accounts/signup/', views.signup_view, name='signup'),
@@ -53,7 +54,10 @@ urlpatterns = [
     path('tag/<int:pk>/edit/', views.UpdateTagView.as_view(), name='tag_update'),
     path('tags/', views.TagListView.as_view(), name='tags'),
     path('tags/add/', views.add_tag, name='tag_add'),
+    path('tags/options/', views.tag_options, name='tag_options'),
     path('tags/merge/', views.merge_tags, name='tags_merge'),
 
+    path('sidebar/<str:section>/', views.sidebar_page, name='sidebar_page'),
+
     path('martor/', include('martor.urls')),
 ]